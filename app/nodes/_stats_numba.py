@@ -0,0 +1,56 @@
+# app/nodes/_stats_numba.py
+"""
+analysis_agent 的可选加速内核（需要 numba）。
+
+grouped_stats 对“拼接后的窗口数组”一次遍历，同时算出每段的
+mean / max / min / slope，替代 reduceat + 单独的趋势拟合。
+没装 numba 时 grouped_stats 为 None，调用方自动走纯 NumPy 路径。
+"""
+from __future__ import annotations
+import numpy as np
+
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
+
+def _grouped_stats(flat, starts, lengths):
+    """
+    flat:    所有窗口首尾相接的 float64 数组
+    starts:  每段在 flat 中的起始下标 (int64)
+    lengths: 每段长度 (int64，均 > 0)
+    返回 (mean, max, min, slope)，slope 在段长 < 3 时为 NaN。
+    """
+    g = starts.shape[0]
+    mean = np.empty(g)
+    mx = np.empty(g)
+    mn = np.empty(g)
+    slope = np.full(g, np.nan)
+    for k in range(g):
+        s0 = starts[k]
+        n = lengths[k]
+        total = 0.0
+        sxy = 0.0
+        lo = flat[s0]
+        hi = flat[s0]
+        for i in range(n):
+            v = flat[s0 + i]
+            total += v
+            sxy += i * v
+            if v < lo:
+                lo = v
+            if v > hi:
+                hi = v
+        mean[k] = total / n
+        mx[k] = hi
+        mn[k] = lo
+        if n >= 3:
+            # x = 0..n-1：Σ(x - x̄)·y = Σxy - x̄·Σy，Σ(x - x̄)² = n(n²-1)/12
+            slope[k] = (sxy - (n - 1) / 2.0 * total) * 12.0 / (n * (n * n - 1.0))
+    return mean, mx, mn, slope
+
+
+grouped_stats = (
+    njit(cache=True, fastmath=True, nogil=True)(_grouped_stats) if njit is not None else None
+)
@@ -1,17 +1,40 @@
 # app/nodes/analysis_agent.py
 from __future__ import annotations
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Iterable, List, Dict, Optional, Sequence, Tuple, Any
 from datetime import datetime, timedelta
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import os
 import pandas as pd, numpy as np
 from dateutil import tz
 
+try:
+    import pyarrow.dataset as pads  # 可选：有 pyarrow 时用 Parquet 旁路文件加速加载
+except Exception:
+    pads = None
+
+try:
+    # 可选：装了 numba 时用一次遍历的融合内核算 mean/max/min/slope
+    from nodes._stats_numba import grouped_stats as _grouped_stats_jit
+except ImportError:
+    _grouped_stats_jit = None
+
 ABS = Path(r"F:\Task\RAG-LangGraph-Demo\data\timeseries.csv")
 REL = Path(__file__).resolve().parents[2] / "data" / "timeseries.csv"
 CSV_PATH = ABS if ABS.exists() else REL
+# CSV 的列式副本（同目录同名 .parquet），由 _ensure_parquet 按需生成
+PARQUET_PATH = CSV_PATH.with_suffix(".parquet")
 
 DEFAULT_TZ = "Asia/Shanghai"
 
+# 一次请求的 tsid 数超过阈值时，按块分给线程池并行做窗口统计
+# （NumPy 归约 / numba nogil 内核都会释放 GIL）；小请求开线程反而更慢
+_PARALLEL_MIN_TSIDS = 512
+_MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+@lru_cache(maxsize=4096)
 def _metric_from_tsid(tsid: str) -> Tuple[str, str, str]:
     t = (tsid or "").lower()
     if ".temp" in t:
@@ -28,17 +51,100 @@ def _metric_from_tsid(tsid: str) -> Tuple[str, str, str]:
     return ("value", "数值", "")
 
 
+@dataclass(frozen=True)
+class LoadedTS:
+    """
+    一次加载的全部产物，按 (路径, mtime) 整体缓存：
+    - df:       清洗后的全量表（tsid 为 category，timestamp 为 UTC）
+    - tsid_set: CSV 中出现过的全部 tsid
+    - sorted:   去掉空值、按 (tsid, timestamp) 排好序的副本，带 int64 纳秒列 ts_ns
+    - by_tsid:  tsid -> 在 sorted 中占据的 [start, end) 行区间
+    约定：调用方只读，不要原地修改其中的 DataFrame。
+    """
+    df: pd.DataFrame
+    tsid_set: frozenset
+    sorted: pd.DataFrame
+    by_tsid: Dict[str, Tuple[int, int]]
+
+
+def _load_ts() -> LoadedTS:
+    """
+    读取 timeseries.csv（装了 pyarrow 时优先读同名 .parquet，类型已就绪，
+    无需再解析时间字符串）。文件不变时直接复用同一个 LoadedTS。
+    """
+    src = _source_path()
+    return _load_ts_cached(src, src.stat().st_mtime_ns)
+
+
 def _load_df() -> pd.DataFrame:
     """
     读取 timeseries.csv，并确保：
-    - tsid: str
+    - tsid: category
     - timestamp: pandas.Timestamp(UTC)
     - value: float
     """
+    return _load_ts().df
+
+
+def _source_path() -> Path:
     if not CSV_PATH.exists():
         raise FileNotFoundError(f"未找到 timeseries.csv: {CSV_PATH}")
+    return _ensure_parquet() or CSV_PATH
+
+
+@lru_cache(maxsize=1)
+def _load_ts_cached(path: Path, mtime_ns: int) -> LoadedTS:
+    """真正的加载逻辑；mtime_ns 只用作缓存键，文件一改动就会重新加载"""
+    df = _read_source(path)
+
+    clean = df[["tsid", "timestamp", "value"]].dropna(subset=["timestamp", "value"])
+    clean = clean.assign(timestamp=clean["timestamp"].dt.as_unit("ns"))
+    clean = clean.sort_values(["tsid", "timestamp"], kind="stable").reset_index(drop=True)
+    # 热路径只比较 int64 UTC 纳秒；tz-aware 的 timestamp 列只留给诊断输出
+    clean["ts_ns"] = clean["timestamp"].array.asi8
+
+    # 同一 tsid 的行是连续的一段：codes 变化处就是段边界
+    codes = clean["tsid"].cat.codes.to_numpy()
+    cats = clean["tsid"].cat.categories
+    cuts = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], cuts)) if codes.size else cuts
+    ends = np.concatenate((cuts, [codes.size])) if codes.size else cuts
+    by_tsid = {str(cats[codes[a]]): (int(a), int(b)) for a, b in zip(starts, ends)}
+
+    return LoadedTS(
+        df=df,
+        # 直接取 category 的类别表，无需遍历整列
+        tsid_set=frozenset(df["tsid"].cat.categories),
+        sorted=clean,
+        by_tsid=by_tsid,
+    )
+
 
-    df = pd.read_csv(CSV_PATH)
+def _read_source(path: Path) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        # 只物化需要的三列；timestamp 落盘时已是 timestamp[ns, tz=UTC]
+        table = pads.dataset(str(path), format="parquet").to_table(
+            columns=["tsid", "timestamp", "value"]
+        )
+        df = table.to_pandas()
+    else:
+        df = _parse_csv(path)
+    # tsid 转成 category：比较/分组都走整数 codes，不再逐行比 Python 字符串
+    df["tsid"] = df["tsid"].astype("category")
+    return df
+
+
+def _window_bounds(
+    ts_ns: np.ndarray, span: Tuple[int, int], start_ns: int, end_ns: int
+) -> Tuple[int, int]:
+    """在某个 tsid 的有序纳秒段 ts_ns[a:b] 上二分定位 [start_ns, end_ns)，返回全局行下标"""
+    a, b = span
+    i0, i1 = np.searchsorted(ts_ns[a:b], (start_ns, end_ns), side="left")
+    return a + int(i0), a + int(i1)
+
+
+def _parse_csv(path: Path) -> pd.DataFrame:
+    df = pd.read_csv(path)
 
     # 列名清洗 + 兼容 ts_id
     df.columns = [str(c).strip() for c in df.columns]
@@ -63,17 +169,51 @@ def _load_df() -> pd.DataFrame:
     return df
 
 
-def _trend(vals: pd.Series) -> Optional[str]:
+def _ensure_parquet() -> Optional[Path]:
+    """
+    保证 PARQUET_PATH 存在且不比 CSV 旧：缺失/过期时从 CSV 重新生成一次。
+    没装 pyarrow 或写盘失败时返回 None，调用方退回直接读 CSV。
+    """
+    if pads is None:
+        return None
+    try:
+        if PARQUET_PATH.exists() and PARQUET_PATH.stat().st_mtime_ns >= CSV_PATH.stat().st_mtime_ns:
+            return PARQUET_PATH
+        df = _parse_csv(CSV_PATH)[["tsid", "timestamp", "value"]]
+        df["timestamp"] = df["timestamp"].dt.as_unit("ns")
+        # 先写临时文件再替换，避免并发读到写了一半的 parquet
+        tmp = PARQUET_PATH.with_suffix(".parquet.tmp")
+        df.to_parquet(tmp, engine="pyarrow", index=False)
+        tmp.replace(PARQUET_PATH)
+        return PARQUET_PATH
+    except Exception:
+        return None
+
+
+def _trend(vals: np.ndarray | pd.Series) -> Optional[str]:
     """
     简单线性拟合斜率判断趋势：
     > 0.02 上升
     < -0.02 下降
     其他 基本稳定
     """
-    if vals.size < 3:
+    y = np.asarray(vals, dtype=np.float64)
+    if y.size < 3:
         return None
-    x = np.arange(vals.size)
-    slope = float(np.polyfit(x, vals.values.astype(float), 1)[0])
+    return _trend_label(_slope(y))
+
+
+def _slope(y: np.ndarray) -> float:
+    """
+    x = 0..n-1 时最小二乘斜率有闭式解：
+    slope = Σ(x - x̄)·y / Σ(x - x̄)²，且 Σ(x - x̄)² = n(n²-1)/12，一次点积即可。
+    """
+    n = y.size
+    xc = np.arange(n, dtype=np.float64) - (n - 1) / 2.0
+    return float(xc @ y) * 12.0 / (n * (n * n - 1.0))
+
+
+def _trend_label(slope: float) -> str:
     if slope > 0.02:
         return "上升"
     if slope < -0.02:
@@ -88,31 +228,79 @@ def _to_utc(dt_like, tz_name: str) -> pd.Timestamp:
     - 若 dt 已带时区：直接 tz_convert('UTC')
     - 传入 datetime 或 pandas.Timestamp 均可
     """
+    # 快路径：已经是带时区的 Timestamp，不必重新构造
+    if isinstance(dt_like, pd.Timestamp) and dt_like.tz is not None:
+        return dt_like if str(dt_like.tz) == "UTC" else dt_like.tz_convert("UTC")
     ts = pd.Timestamp(dt_like)
     if ts.tz is None:
         ts = ts.tz_localize(tz_name)
     return ts.tz_convert("UTC")
 
 # ===== 指标计算注册表 =====
-def _stat_avg(vals: pd.Series) -> float | None:
-    if vals.empty:
-        return None
-    return float(vals.mean())
-
-def _stat_max(vals: pd.Series) -> float | None:
-    if vals.empty:
-        return None
-    return float(vals.max())
-
-def _stat_min(vals: pd.Series) -> float | None:
-    if vals.empty:
-        return None
-    return float(vals.min())
-
-def _stat_trend(vals: pd.Series) -> str | None:
-    if vals.empty:
+@dataclass
+class _Window:
+    """某个 tsid 在时间窗口内的数值（已去空、按时间升序），以及批量算好的基础聚合"""
+    values: np.ndarray
+    n: int = 0
+    mean: Optional[float] = None
+    max: Optional[float] = None
+    min: Optional[float] = None
+    slope: Optional[float] = None  # 仅融合内核会预先算好；否则由 _stat_trend 按需计算
+
+
+def _batch_windows(segments: List[np.ndarray]) -> List[_Window]:
+    """
+    把所有 tsid 的窗口拼成一段连续数组，用一次 reduceat 同时算出每段的
+    sum/max/min，避免逐个 tsid 调 pandas 的小归约。
+    """
+    lengths = np.array([seg.size for seg in segments], dtype=np.int64)
+    out = [_Window(values=seg, n=int(k)) for seg, k in zip(segments, lengths)]
+    nonempty = np.flatnonzero(lengths)
+    if nonempty.size == 0:
+        return out
+
+    flat = np.concatenate([segments[i] for i in nonempty]).astype(np.float64, copy=False)
+    starts = np.concatenate(([0], np.cumsum(lengths[nonempty])[:-1]))
+    if _grouped_stats_jit is not None:
+        means, maxs, mins, slopes = _grouped_stats_jit(flat, starts, lengths[nonempty])
+    else:
+        means = np.add.reduceat(flat, starts) / lengths[nonempty]
+        maxs = np.maximum.reduceat(flat, starts)
+        mins = np.minimum.reduceat(flat, starts)
+        slopes = None
+    for j, i in enumerate(nonempty):
+        w = out[i]
+        w.mean, w.max, w.min = float(means[j]), float(maxs[j]), float(mins[j])
+        if slopes is not None and w.n >= 3:
+            w.slope = float(slopes[j])
+    return out
+
+
+def _batch_windows_parallel(segments: List[np.ndarray]) -> List[_Window]:
+    """_batch_windows 的分块并行版；窗口数不够多时直接单线程算"""
+    if len(segments) < _PARALLEL_MIN_TSIDS or _MAX_WORKERS < 2:
+        return _batch_windows(segments)
+    step = -(-len(segments) // _MAX_WORKERS)
+    chunks = [segments[i:i + step] for i in range(0, len(segments), step)]
+    with ThreadPoolExecutor(max_workers=len(chunks)) as ex:
+        return [w for part in ex.map(_batch_windows, chunks) for w in part]
+
+
+def _stat_avg(w: _Window) -> float | None:
+    return w.mean if w.n else None
+
+def _stat_max(w: _Window) -> float | None:
+    return w.max if w.n else None
+
+def _stat_min(w: _Window) -> float | None:
+    return w.min if w.n else None
+
+def _stat_trend(w: _Window) -> str | None:
+    if not w.n:
         return None
-    return _trend(vals)
+    if w.slope is not None:
+        return _trend_label(w.slope)
+    return _trend(w.values)
 
 # 注册表：LLM 可以请求这些指标名
 _METRIC_REGISTRY = {
@@ -142,8 +330,8 @@ def analyze(
     # 统一 tsids 成 list[str]
     tsids = [str(tsids)] if isinstance(tsids, (str, int)) else [str(t) for t in tsids]
 
-    df = _load_df()
-    tsid_set = set(df["tsid"])
+    loaded = _load_ts()
+    tsid_set = loaded.tsid_set
 
     results: List[Dict[str, Any]] = []
 
@@ -178,6 +366,27 @@ def analyze(
     # === 情况2：有窗口，正常分析 ===
     start_utc = _to_utc(start, tz_name)
     end_utc = _to_utc(end, tz_name)
+    # 诊断用的窗口字符串对所有 tsid 都一样，只算一次
+    window_utc = [str(start_utc), str(end_utc)]
+    window_local = [str(start_utc.tz_convert(tz_name)), str(end_utc.tz_convert(tz_name))]
+    csv_path = str(CSV_PATH)
+
+    # 每个 tsid 在有序副本里占连续一段，二分出窗口即可，不再扫全表；
+    # 各窗口的 avg/max/min 一次性批量算好
+    srt, offsets = loaded.sorted, loaded.by_tsid
+    ts_ns = srt["ts_ns"].to_numpy()
+    values = srt["value"].to_numpy()
+    start_ns, end_ns = start_utc.value, end_utc.value
+    located: Dict[str, Tuple[int, int]] = {}
+    for tsid in dict.fromkeys(tsids):
+        span = offsets.get(tsid)
+        if span is not None:
+            located[tsid] = _window_bounds(ts_ns, span, start_ns, end_ns)
+    windows = dict(zip(
+        located,
+        _batch_windows_parallel([values[i0:i1] for i0, i1 in located.values()]),
+    ))
+    empty_window = _Window(values=np.empty(0))
 
     for tsid in tsids:
         metric, metric_zh, unit = _metric_from_tsid(tsid)
@@ -193,12 +402,9 @@ def analyze(
                 "n": 0,
                 "_diag": {
                     "reason": "tsid_not_found_in_csv",
-                    "csv_path": str(CSV_PATH),
-                    "window_utc": [str(start_utc), str(end_utc)],
-                    "window_local": [
-                        str(pd.Timestamp(start_utc).tz_convert(tz_name)),
-                        str(pd.Timestamp(end_utc).tz_convert(tz_name)),
-                    ],
+                    "csv_path": csv_path,
+                    "window_utc": list(window_utc),
+                    "window_local": list(window_local),
                     "samples": 0,
                 }
             }
@@ -208,13 +414,13 @@ def analyze(
             continue
 
         # 情况2b：CSV 里有 tsid，取窗口内的值
-        mask = (
-            (df["tsid"] == tsid) &
-            (df["timestamp"] >= start_utc) &
-            (df["timestamp"] < end_utc)
-        )
-        sub = df.loc[mask, ["timestamp", "value"]].dropna()
-        vals = sub["value"]
+        win = windows.get(tsid, empty_window)
+        if win.n:
+            i0, i1 = located[tsid]
+            first_ts = str(srt["timestamp"].iloc[i0])
+            last_ts = str(srt["timestamp"].iloc[i1 - 1])
+        else:
+            first_ts = last_ts = None
 
         item: Dict[str, Any] = {
             "tsid": tsid,
@@ -222,17 +428,14 @@ def analyze(
             "metric": metric,
             "metric_zh": metric_zh,
             "unit": unit,
-            "n": int(vals.size),
+            "n": win.n,
             "_diag": {
-                "csv_path": str(CSV_PATH),
-                "window_utc": [str(start_utc), str(end_utc)],
-                "window_local": [
-                    str(pd.Timestamp(start_utc).tz_convert(tz_name)),
-                    str(pd.Timestamp(end_utc).tz_convert(tz_name)),
-                ],
-                "first_ts": str(sub["timestamp"].min()) if not sub.empty else None,
-                "last_ts":  str(sub["timestamp"].max()) if not sub.empty else None,
-                "samples": int(sub.shape[0]),
+                "csv_path": csv_path,
+                "window_utc": list(window_utc),
+                "window_local": list(window_local),
+                "first_ts": first_ts,
+                "last_ts":  last_ts,
+                "samples": win.n,
             },
         }
 
@@ -240,7 +443,7 @@ def analyze(
         for w in want:
             func = _METRIC_REGISTRY.get(w)
             try:
-                item[w] = func(vals) if callable(func) else None
+                item[w] = func(win) if callable(func) else None
             except Exception as e:
                 item[w] = None
                 # 把单项报错记到 _diag_errors，不让整个 flow 崩
@@ -301,14 +504,13 @@ def quick_probe(tsid: str, hours: int = 24, tz_name: str = DEFAULT_TZ):
     start_utc = _to_utc(start_local, tz_name)
     end_utc = _to_utc(end_local, tz_name)
 
-    df = _load_df()
-    exists = tsid in set(df["tsid"])
-    mask = (
-        (df["tsid"] == tsid) &
-        (df["timestamp"] >= start_utc) &
-        (df["timestamp"] < end_utc)
+    loaded = _load_ts()
+    exists = tsid in loaded.tsid_set
+    srt = loaded.sorted
+    i0, i1 = _window_bounds(
+        srt["ts_ns"].to_numpy(), loaded.by_tsid.get(tsid, (0, 0)), start_utc.value, end_utc.value
     )
-    sub = df.loc[mask, ["timestamp", "value"]].dropna()
+    sub = srt.iloc[i0:i1][["timestamp", "value"]]
 
     print("CSV_PATH:", str(CSV_PATH))
     print("TSID exists in CSV:", exists)
@@ -345,14 +547,26 @@ def analyze_point_in_time_state(state: Dict) -> List[Dict]:
     target_local = pd.to_datetime(target_time_iso)
     target_utc = _to_utc(target_local.to_pydatetime(), DEFAULT_TZ)
 
-    df = _load_df()
+    loaded = _load_ts()
+    tsid_set = loaded.tsid_set
+    srt, offsets = loaded.sorted, loaded.by_tsid
+    ts_ns = srt["ts_ns"].to_numpy()
+    values = srt["value"].to_numpy()
+
+    # 目标点之后 3 分钟内都算命中；一次二分同时得到“精确命中”和“窗口命中”
+    start_utc = target_utc
+    end_utc = target_utc + timedelta(hours=0.05)
+    target_ns, end_ns = start_utc.value, end_utc.value
+    # 诊断字符串对所有 tsid 相同，循环外格式化一次
+    target_str = str(target_local)
+    window_str = f"{start_utc} to {end_utc}"
     results = []
 
     for tsid in tsids:
         metric, metric_zh, unit = _metric_from_tsid(tsid)
 
         # 检查TSID是否存在
-        if tsid not in set(df["tsid"]):
+        if tsid not in tsid_set:
             results.append({
                 "tsid": tsid,
                 "metric": metric,
@@ -364,17 +578,12 @@ def analyze_point_in_time_state(state: Dict) -> List[Dict]:
             })
             continue
 
-        # 直接查找该精确时间点的数据
-        mask = (
-                (df["tsid"] == tsid) &
-                (df["timestamp"] == target_utc)
-        )
-        exact_match = df.loc[mask]
+        span = offsets.get(tsid)
+        i0, i1 = _window_bounds(ts_ns, span, target_ns, end_ns) if span else (0, 0)
 
-        if not exact_match.empty:
+        if i1 > i0 and ts_ns[i0] == target_ns:
             # 找到精确匹配 - 修复：直接提取数值
-            match_row = exact_match.iloc[0]
-            value = float(match_row['value'])
+            value = float(values[i0])
 
             results.append({
                 "tsid": tsid,
@@ -388,59 +597,47 @@ def analyze_point_in_time_state(state: Dict) -> List[Dict]:
                 "n": 1,
                 "_diag": {
                     "reason": "exact_match",
-                    "target_time": str(target_local),
-                    "actual_time": str(match_row['timestamp'])
+                    "target_time": target_str,
+                    "actual_time": str(srt["timestamp"].iloc[i0])
+                }
+            })
+        elif i1 > i0:
+            # 没有精确匹配，但窗口内有数据
+            vals = values[i0:i1]
+            results.append({
+                "tsid": tsid,
+                "metric": metric,
+                "metric_zh": metric_zh,
+                "unit": unit,
+                "value": float(vals[0]),  # 取第一个值
+                "avg": float(vals.mean()),
+                "max": float(vals.max()),
+                "min": float(vals.min()),
+                "n": len(vals),
+                "_diag": {
+                    "reason": "window_match",
+                    "target_time": target_str,
+                    "window_data_points": len(vals),
+                    "first_timestamp": str(srt["timestamp"].iloc[i0])
                 }
             })
         else:
-            # 没有精确匹配，尝试在1小时窗口内查找（使用原有时窗逻辑）
-            start_utc = target_utc
-            end_utc = target_utc + timedelta(hours=0.05)
-
-            mask = (
-                    (df["tsid"] == tsid) &
-                    (df["timestamp"] >= start_utc) &
-                    (df["timestamp"] < end_utc)
-            )
-            window_data = df.loc[mask, ["timestamp", "value"]].dropna()
-
-            if not window_data.empty:
-                # 在时间窗口内有数据
-                vals = window_data["value"]
-                results.append({
-                    "tsid": tsid,
-                    "metric": metric,
-                    "metric_zh": metric_zh,
-                    "unit": unit,
-                    "value": float(vals.iloc[0]),  # 取第一个值
-                    "avg": float(vals.mean()),
-                    "max": float(vals.max()),
-                    "min": float(vals.min()),
-                    "n": len(vals),
-                    "_diag": {
-                        "reason": "window_match",
-                        "target_time": str(target_local),
-                        "window_data_points": len(vals),
-                        "first_timestamp": str(window_data["timestamp"].iloc[0])
-                    }
-                })
-            else:
-                # 完全没数据
-                results.append({
-                    "tsid": tsid,
-                    "metric": metric,
-                    "metric_zh": metric_zh,
-                    "unit": unit,
-                    "value": None,
-                    "avg": None,
-                    "max": None,
-                    "min": None,
-                    "n": 0,
-                    "_diag": {
-                        "reason": "no_data_in_window",
-                        "target_time": str(target_local),
-                        "window": f"{start_utc} to {end_utc}"
-                    }
-                })
-
-    return results
\ No newline at end of file
+            # 完全没数据
+            results.append({
+                "tsid": tsid,
+                "metric": metric,
+                "metric_zh": metric_zh,
+                "unit": unit,
+                "value": None,
+                "avg": None,
+                "max": None,
+                "min": None,
+                "n": 0,
+                "_diag": {
+                    "reason": "no_data_in_window",
+                    "target_time": target_str,
+                    "window": window_str
+                }
+            })
+
+    return results
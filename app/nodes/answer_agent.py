@@ -1,9 +1,16 @@
 # app/nodes/answer_agent.py
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 from pathlib import Path
 from functools import lru_cache
-import os, json, re
+from itertools import islice
+import os, json, re, math
+import numpy as np
+
+try:
+    import orjson  # 可选：有 orjson 时序列化上下文更快
+except ImportError:
+    orjson = None
 
 # ============== Prompt 文件（只从磁盘读取；不存在就报错） ==============
 ABS_PROMPT = Path(r"F:\Task\RAG-LangGraph-Demo\prompt\prompt-answer.md")
@@ -17,10 +24,18 @@ def _load_prompt_text() -> str:
         return REL_PROMPT.read_text(encoding="utf-8")
     raise RuntimeError(f"找不到回答用的 Prompt 文件：{ABS_PROMPT} 或 {REL_PROMPT}")
 
+# prompt 文件里按 “## zh” / “## en” 分段
+_SECTION_RE = re.compile(r"(?im)^##\s+")
+
+@lru_cache(maxsize=1)
+def _load_prompt_bodies() -> Tuple[str, str]:
+    """(中文正文, 英文正文)；文件只读一次、只切分一次"""
+    md = _load_prompt_text()
+    return _extract_lang(md, prefer_zh=True), _extract_lang(md, prefer_zh=False)
+
 def _extract_lang(md: str, prefer_zh: bool) -> str:
-    import re as _re
     target = "zh" if prefer_zh else "en"
-    parts = _re.split(r"(?im)^##\s+", md.strip())
+    parts = _SECTION_RE.split(md.strip())
     for part in parts[1:]:
         head, _, body = part.partition("\n")
         if head.strip().lower().startswith(target):
@@ -28,28 +43,31 @@ def _extract_lang(md: str, prefer_zh: bool) -> str:
     return md.strip()
 
 # ============== 与 rag_agent 相同风格的 LLM 懒加载 ==============
-_LLM = None
+@lru_cache(maxsize=None)
 def _get_llm():
-    global _LLM
-    if _LLM is not None:
-        return _LLM
+    # 缺 key 时抛异常，异常不会被 lru_cache 记住，补上 key 后还能重试
     api_key = os.environ.get("DEEPSEEK_API_KEY")
     if not api_key:
         raise RuntimeError("未发现 DEEPSEEK_API_KEY")
     from langchain.chat_models import init_chat_model
-    _LLM = init_chat_model("deepseek:deepseek-chat", temperature=0, api_key=api_key)
-    return _LLM
+    return init_chat_model("deepseek:deepseek-chat", temperature=0, api_key=api_key)
 
 # ============== 清洗工具 ==============
+_ZH_RE = re.compile("[\u4e00-\u9fff]")
+_DATE_PREFIX_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})")
+# 去掉 LLM 偶尔包在回答外面的 ``` 代码围栏
+_FENCE_OPEN_RE = re.compile(r"^```(?:\w+)?\s*")
+_FENCE_CLOSE_RE = re.compile(r"\s*```$")
+
 def _is_zh(text: str) -> bool:
-    return any("\u4e00" <= ch <= "\u9fff" for ch in (text or ""))
+    return _ZH_RE.search(text or "") is not None
 
 def _short(s: str) -> str:
     s = str(s or "").strip()
     if "#" in s:
-        s = s.rsplit("#", 1)[-1]
+        s = s.rpartition("#")[2]
     if "/" in s:
-        s = s.rstrip("/").rsplit("/", 1)[-1]
+        s = s.rstrip("/").rpartition("/")[2]
     return s
 
 def _clean_rows(
@@ -69,7 +87,7 @@ def _clean_rows(
         return rows
 
     out: List[Dict[str, Any]] = []
-    for r in rows:
+    for r in islice(rows, limit):
         out.append({
             "room": _short(r.get("room") or r.get("Room") or ""),
             "name": _short(r.get("pt") or r.get("sensor") or r.get("point") or ""),
@@ -80,8 +98,6 @@ def _clean_rows(
                 else ""
             ),
         })
-        if len(out) >= limit:
-            break
     return out
 
 
@@ -111,7 +127,7 @@ def _clean_time_window(time_window: Dict[str, Any] | None) -> Dict[str, Any]:
     start_local = str(tw.get("start_local") or "")
     end_local = str(tw.get("end_local") or "")
     def _just_date(iso_str: str) -> str:
-        m = re.match(r"^(\d{4}-\d{2}-\d{2})", iso_str.strip())
+        m = _DATE_PREFIX_RE.match(iso_str.strip())
         return m.group(1) if m else ""
     return {
         "label": tw.get("label"),
@@ -119,6 +135,34 @@ def _clean_time_window(time_window: Dict[str, Any] | None) -> Dict[str, Any]:
         "end_local_date": _just_date(end_local),
     }
 
+def _to_plain(obj: Any) -> Any:
+    """numpy 标量/数组转成 Python 数，NaN/inf 转成 None：orjson 和 json 两条路径据此输出同样的文本"""
+    if isinstance(obj, dict):
+        return {k: _to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_plain(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _to_plain(obj.tolist())
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    return obj
+
+def _dumps_ctx(ctx: Dict[str, Any]) -> str:
+    """
+    上下文 → 缩进 JSON 字符串；Timestamp/datetime 等非 JSON 类型一律转成 str。
+    orjson 原生会把 datetime 写成 ISO 的 T 格式、把 dataclass 展开，这里都交还给 default=str，与 json 一致
+    """
+    ctx = _to_plain(ctx)
+    if orjson is not None:
+        return orjson.dumps(
+            ctx, default=str,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+        ).decode("utf-8")
+    return json.dumps(ctx, ensure_ascii=False, indent=2, default=str)
+
 # ============== Prompt 拼装增强 ==============
 def _augment_prompt(base_prompt: str, prefer_zh: bool, question_type: str | None = None) -> str:
     """
@@ -183,27 +227,28 @@ def compose(
     question_type = hints.get("question_type")
 
     # 1. 基础 prompt + 任务特化补丁
-    base_prompt = _extract_lang(_load_prompt_text(), prefer_zh=zh)
+    zh_body, en_body = _load_prompt_bodies()
+    base_prompt = zh_body if zh else en_body
     system_prompt = _augment_prompt(base_prompt, prefer_zh=zh, question_type=question_type)
 
     # 2. 压缩输入
     rows_clean = _clean_rows(rows, query_type=hints.get("question_type"))
     analysis_clean = _clean_analysis(analysis)
     time_window_clean = _clean_time_window(time_window)
-    all_rooms_clean: List[str] = []
-    if topology_all_rooms:
-        seen = set()
-        for r in topology_all_rooms:
-            room_id = _short(
+    # dict.fromkeys：保序去重
+    all_rooms_clean: List[str] = [
+        room_id for room_id in dict.fromkeys(
+            _short(
                 r.get("room")
                 or r.get("Room")
                 or r.get("room_id")
                 or r.get("space")
                 or ""
             )
-            if room_id and room_id not in seen:
-                seen.add(room_id)
-                all_rooms_clean.append(room_id)
+            for r in (topology_all_rooms or [])
+        )
+        if room_id
+    ]
     # 3. 构造上下文
     ctx = {
         "question": user_query,
@@ -234,7 +279,7 @@ def compose(
 
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": json.dumps(ctx, ensure_ascii=False, indent=2)},
+        {"role": "user", "content": _dumps_ctx(ctx)},
     ]
 
     llm = _get_llm()
@@ -244,6 +289,6 @@ def compose(
     except Exception:
         text = llm.predict(messages)
 
-    text = re.sub(r"^```(?:\w+)?\s*", "", str(text).strip())
-    text = re.sub(r"\s*```$", "", text.strip())
+    text = _FENCE_OPEN_RE.sub("", str(text).strip())
+    text = _FENCE_CLOSE_RE.sub("", text.strip())
     return text.strip()
@@ -15,11 +15,23 @@ from dateutil import tz
 from typing import Dict, Tuple, Any
 
 DEFAULT_TZ = "Asia/Shanghai"
+# 本模块只依赖 datetime/dateutil，不要引入 pandas/numpy（节点冷启动更快）
+_DEFAULT_ZONE = tz.gettz(DEFAULT_TZ)
+
+# tz 名 -> tzinfo；gettz 每次都要查 tzdata，解析一次后复用
+_TZ_CACHE: Dict[str, Any] = {DEFAULT_TZ: _DEFAULT_ZONE}
 
 
 # ========== 工具函数 ==========
+def _get_zone(tz_name: str):
+    zone = _TZ_CACHE.get(tz_name)
+    if zone is None:
+        zone = _TZ_CACHE[tz_name] = tz.gettz(tz_name)
+    return zone
+
+
 def _now_local(tz_name: str) -> datetime:
-    return datetime.now(tz.gettz(tz_name))
+    return datetime.now(_get_zone(tz_name))
 
 
 def _start_of_day(dt: datetime) -> datetime:
@@ -28,17 +40,16 @@ def _start_of_day(dt: datetime) -> datetime:
 
 
 def _parse_dt(s: str, tz_name: str) -> datetime:
-    """解析 'YYYY-MM-DD' 或 'YYYY-MM-DDTHH:MM'"""
+    """解析 'YYYY-MM-DD' 或 'YYYY-MM-DDTHH:MM'（以及其它 ISO 8601 写法）"""
     if not s:
         raise ValueError("空字符串无法解析时间")
-    fmt_list = ["%Y-%m-%dT%H:%M", "%Y-%m-%d"]
-    for fmt in fmt_list:
-        try:
-            dt_naive = datetime.strptime(s, fmt)
-            return dt_naive.replace(tzinfo=tz.gettz(tz_name))
-        except ValueError:
-            pass
-    raise ValueError(f"无法解析时间字符串: {s}")
+    try:
+        # fromisoformat 是 C 实现，两种常见写法都能直接解析，不用逐个试 strptime 格式
+        dt = datetime.fromisoformat(s)
+    except ValueError:
+        raise ValueError(f"无法解析时间字符串: {s}") from None
+    # 字符串自带时区偏移就保留，否则按 tz_name 理解
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=_get_zone(tz_name))
 
 
 # ========== 时间窗口生成 ==========
@@ -1,17 +1,38 @@
 from __future__ import annotations
-import os, json, re
+import os, json, re, copy, hashlib, threading, asyncio
+from collections import OrderedDict
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+from typing import Dict, List, Optional, Any, Union, Tuple
+from datetime import date
+from functools import lru_cache
 
 # ============== 配置和初始化 ==============
 ABS_PROMPT = Path(r"F:\Task\RAG-LangGraph-Demo\prompt\prompt.md")
 REL_PROMPT = Path(__file__).resolve().parents[2] / "prompt" / "prompt.md"
+# 结果里 _prompt 字段用的路径串：导入时判定一次，不必每次解析都 stat 一遍
+_PROMPT_PATH_STR = str(ABS_PROMPT if ABS_PROMPT.exists() else REL_PROMPT)
 _prompt_cache: Optional[str] = None
-_LLM = None
+# (日期, “带当天日期的 prompt + 用户问题前缀”)；跨天才重新拼接
+_prompt_with_date: Optional[Tuple[date, str]] = None
+
+try:
+    from diskcache import Cache as _DiskCache  # 可选：跨进程/重启复用 LLM 解析结果
+except ImportError:
+    _DiskCache = None
+
+# LLM 解析结果缓存：键 = sha256(带当天日期的完整 prompt + 问题)，
+# 日期变了/prompt 改了自然失效；只缓存成功解析的结果
+_PARSE_CACHE_DIR = Path(__file__).resolve().parents[2] / "data" / "llm_cache"
+_PARSE_CACHE_TTL = 30 * 24 * 3600
+_PARSE_LRU_MAX = 1024
+_PARSE_LRU: "OrderedDict[str, Dict]" = OrderedDict()
+_PARSE_LOCK = threading.Lock()
+_PARSE_DISK = None
 
 
 def _load_prompt() -> Optional[str]:
+    # 只缓存读成功的结果：文件暂时缺失/读不了时返回 None（或抛错），下次调用再试
     global _prompt_cache
     if _prompt_cache is not None:
         return _prompt_cache
@@ -22,33 +43,95 @@ def _load_prompt() -> Optional[str]:
     return None
 
 
-def _get_llm():
-    global _LLM
-    if _LLM is not None:
-        return _LLM
+def _dated_prompt_prefix(prompt: str) -> str:
+    global _prompt_with_date
+    today = date.today()
+    if _prompt_with_date is None or _prompt_with_date[0] != today:
+        current_time = today.strftime("%Y年%m月%d日")
+        dynamic_prompt = f"**重要：当前系统时间是 {current_time}。**\n\n{prompt}"
+        _prompt_with_date = (today, f"{dynamic_prompt}\n\n用户问题：")
+    return _prompt_with_date[1]
+
 
+def _get_llm():
     api_key = os.environ.get("DEEPSEEK_API_KEY")
     if not api_key:
         return None
-
     try:
-        from langchain.chat_models import init_chat_model
-        _LLM = init_chat_model("deepseek:deepseek-chat", temperature=0, api_key=api_key)
-        return _LLM
+        return _init_llm(api_key)
     except Exception:
         return None
 
 
+@lru_cache(maxsize=None)
+def _init_llm(api_key: str):
+    # 按 key 缓存：没配 key / 初始化失败不会被缓存，之后补上还能重试
+    from langchain.chat_models import init_chat_model
+    return init_chat_model("deepseek:deepseek-chat", temperature=0, api_key=api_key)
+
+
+# ============== LLM 解析缓存 ==============
+def _get_parse_disk():
+    global _PARSE_DISK
+    if _PARSE_DISK is None and _DiskCache is not None:
+        try:
+            _PARSE_DISK = _DiskCache(str(_PARSE_CACHE_DIR))
+        except Exception:
+            return None
+    return _PARSE_DISK
+
+
+def _parse_cache_get(key: str) -> Optional[Dict]:
+    with _PARSE_LOCK:
+        hit = _PARSE_LRU.get(key)
+        if hit is not None:
+            _PARSE_LRU.move_to_end(key)
+    if hit is None:
+        disk = _get_parse_disk()
+        try:
+            hit = disk.get(key) if disk is not None else None
+        except Exception:
+            hit = None
+        if hit is None:
+            return None
+        with _PARSE_LOCK:
+            _PARSE_LRU[key] = hit
+            if len(_PARSE_LRU) > _PARSE_LRU_MAX:
+                _PARSE_LRU.popitem(last=False)
+    # 下游会修改 hints（比如写入 question），返回副本
+    return copy.deepcopy(hit)
+
+
+def _parse_cache_put(key: str, value: Dict) -> None:
+    value = copy.deepcopy(value)
+    with _PARSE_LOCK:
+        _PARSE_LRU[key] = value
+        _PARSE_LRU.move_to_end(key)
+        if len(_PARSE_LRU) > _PARSE_LRU_MAX:
+            _PARSE_LRU.popitem(last=False)
+    disk = _get_parse_disk()
+    if disk is not None:
+        try:
+            disk.set(key, value, expire=_PARSE_CACHE_TTL)
+        except Exception:
+            pass
+
+
 # ============== 工具函数 ==============
+_JSON_RE = re.compile(r"\{.*\}", re.S)
+_ROOM_RE = re.compile(r"(?<!\d)(\d{1,4})(?!\d)")
+
+
 def _safe_json_from_text(s: str) -> Optional[Dict]:
     if not s:
         return None
-    m = re.search(r"\{.*\}", s, flags=re.S)
+    m = _JSON_RE.search(s)
     txt = m.group(0) if m else s
     try:
-        return json.loads(txt) if isinstance(json.loads(txt), dict) else None
+        parsed = json.loads(txt)
     except Exception:
         return None
+    return parsed if isinstance(parsed, dict) else None
 
 
 def _neutral(question: str, source_reason: str) -> Dict:
@@ -56,7 +139,7 @@ def _neutral(question: str, source_reason: str) -> Dict:
         "question_type": "other", "topology_intent": None, "need_stats": False,
         "need": None, "room": None, "metric": None, "time_range": None,
         "uncertain": True, "ambiguities": [], "_source": source_reason,
-        "_prompt": str(ABS_PROMPT if ABS_PROMPT.exists() else REL_PROMPT),
+        "_prompt": _PROMPT_PATH_STR,
     }
 
 
@@ -86,9 +169,12 @@ def llm_parse(question: str) -> Dict:
         return _neutral(question, "no-llm")
 
     try:
-        current_time = datetime.now().strftime("%Y年%m月%d日")
-        dynamic_prompt = f"**重要：当前系统时间是 {current_time}。**\n\n{prompt}"
-        full_prompt = f"{dynamic_prompt}\n\n用户问题：{question or ''}"
+        full_prompt = _dated_prompt_prefix(prompt) + (question or "")
+
+        cache_key = hashlib.sha256(full_prompt.encode("utf-8")).hexdigest()
+        cached = _parse_cache_get(cache_key)
+        if cached is not None:
+            return cached
 
         try:
             resp = llm.invoke(full_prompt)
@@ -96,55 +182,102 @@ def llm_parse(question: str) -> Dict:
         except Exception:
             text = llm.predict(full_prompt)
 
-        data = _safe_json_from_text(text)
-        if not data:
-            return _neutral(question, "parse-error")
-
-        # 字段清洗
-        qtype = str(data.get("question_type", "other")).lower()
-        qtype = qtype if qtype in ALLOWED_QTYPE else "other"
-
-        topo_intent = data.get("topology_intent")
-        if isinstance(topo_intent, str):
-            topo_intent = topo_intent.lower().strip()
-            topo_intent = topo_intent if topo_intent in ALLOWED_TOPO_INTENT else None
-
-        need = _normalize_need(data.get("need"))
-        need_stats = bool(data.get("need_stats")) or bool(need)
-
-        room = data.get("room")
-        if isinstance(room, str):
-            mm = re.search(r"(?<!\d)(\d{1,4})(?!\d)", room)
-            room = mm.group(1) if mm else None
-
-        metric = data.get("metric")
-        metric_allow = ("temp", "rh", "lux", "co2", "pm25")
-        metric = metric if metric in metric_allow else None
-
-        time_range = data.get("time_range")
-        if not isinstance(time_range, dict) or "kind" not in time_range:
-            time_range = None
-
-        uncertain = bool(data.get("uncertain", False))
-        ambiguities = data.get("ambiguities") or []
-        if not isinstance(ambiguities, list):
-            ambiguities = [str(ambiguities)]
-
-        return {
-            "question_type": qtype, "topology_intent": topo_intent, "need_stats": need_stats,
-            "need": need, "room": room, "metric": metric, "time_range": time_range,
-            "uncertain": uncertain, "ambiguities": ambiguities, "_source": "llm",
-            "_prompt": str(ABS_PROMPT if ABS_PROMPT.exists() else REL_PROMPT),
-        }
+        return _finish_parse(question, text, cache_key)
     except Exception:
         return _neutral(question, "llm-error")
 
 
+async def allm_parse(question: str) -> Dict:
+    """llm_parse 的协程版：用 ainvoke 发请求，等待网络期间事件循环可以做别的事"""
+    prompt = _load_prompt()
+    if not prompt:
+        return _neutral(question, "no-prompt")
+
+    llm = _get_llm()
+    if llm is None:
+        return _neutral(question, "no-llm")
+
+    try:
+        full_prompt = _dated_prompt_prefix(prompt) + (question or "")
+
+        cache_key = hashlib.sha256(full_prompt.encode("utf-8")).hexdigest()
+        cached = _parse_cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            resp = await llm.ainvoke(full_prompt)
+            text = getattr(resp, "content", None) or (resp if isinstance(resp, str) else "")
+        except Exception:
+            text = await asyncio.to_thread(llm.predict, full_prompt)
+
+        return _finish_parse(question, text, cache_key)
+    except Exception:
+        return _neutral(question, "llm-error")
+
+
+def _finish_parse(question: str, text: str, cache_key: str) -> Dict:
+    """LLM 原始输出 -> 清洗后的 hints；解析成功才写缓存"""
+    data = _safe_json_from_text(text)
+    if not data:
+        return _neutral(question, "parse-error")
+
+    # 字段清洗
+    qtype = str(data.get("question_type", "other")).lower()
+    qtype = qtype if qtype in ALLOWED_QTYPE else "other"
+
+    topo_intent = data.get("topology_intent")
+    if isinstance(topo_intent, str):
+        topo_intent = topo_intent.lower().strip()
+        topo_intent = topo_intent if topo_intent in ALLOWED_TOPO_INTENT else None
+
+    need = _normalize_need(data.get("need"))
+    need_stats = bool(data.get("need_stats")) or bool(need)
+
+    room = data.get("room")
+    if isinstance(room, str):
+        mm = _ROOM_RE.search(room)
+        room = mm.group(1) if mm else None
+
+    metric = data.get("metric")
+    metric_allow = ("temp", "rh", "lux", "co2", "pm25")
+    metric = metric if metric in metric_allow else None
+
+    time_range = data.get("time_range")
+    if not isinstance(time_range, dict) or "kind" not in time_range:
+        time_range = None
+
+    uncertain = bool(data.get("uncertain", False))
+    ambiguities = data.get("ambiguities") or []
+    if not isinstance(ambiguities, list):
+        ambiguities = [str(ambiguities)]
+
+    result = {
+        "question_type": qtype, "topology_intent": topo_intent, "need_stats": need_stats,
+        "need": need, "room": room, "metric": metric, "time_range": time_range,
+        "uncertain": uncertain, "ambiguities": ambiguities, "_source": "llm",
+        "_prompt": _PROMPT_PATH_STR,
+    }
+    _parse_cache_put(cache_key, result)
+    return result
+
+
 # ============== Graph 接口 ==============
 def get_hints(question: str) -> Dict:
     return llm_parse(question)
 
 
+async def aget_hints_and_context(question: str, k: int = 5) -> Tuple[Dict, List[Dict]]:
+    """
+    LLM 解析（网络等待，秒级）与 Faiss 检索（本地 CPU，毫秒级）并发执行，
+    返回 (hints, chunks)；检索放到线程里跑，不阻塞事件循环。
+    """
+    hints, chunks = await asyncio.gather(
+        allm_parse(question), asyncio.to_thread(search, question, k)
+    )
+    return hints, chunks
+
+
 def need_stats(question: str) -> bool:
     try:
         return bool(llm_parse(question).get("need_stats"))
@@ -156,68 +289,268 @@ def need_stats(question: str) -> bool:
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-from rdflib import Graph
-
-_FAISS_INDEX: Optional[faiss.IndexFlatIP] = None
-_FAISS_TEXTS: List[str] = []
+from nodes import topology_store
+from nodes.sparql_util import clean_sparql_response as _clean_sparql_response
+
+# 批量查询时让 Faiss 的 OpenMP 用满全部核
+if hasattr(faiss, "omp_set_num_threads"):
+    faiss.omp_set_num_threads(os.cpu_count() or 1)
+
+# 二值索引粗召回 + fp32 精排：_FAISS_EMB 是落盘的 fp16 归一化向量（mmap 只读，按需上转）
+_FAISS_BINARY: Optional[faiss.IndexBinary] = None
+_FAISS_EMB: Optional[np.ndarray] = None
+_RERANK_OVERSAMPLE = 4
+# 冷启动时 abatch 的多个 to_thread(search) 会同时进来：模型和索引都用双重检查加锁只初始化一次
+_SBERT_LOCK = threading.Lock()
 _SBERT_MODEL: Optional[SentenceTransformer] = None
+_INDEX_LOCK = threading.Lock()
+_FAISS_STATE: Optional[Tuple[List[str], np.ndarray]] = None  # (语料, fp16 向量 mmap)
+_FAISS_FLOAT: Optional[faiss.Index] = None  # SQ8 浮点索引：只在二值精排不可用时才建
+
+
+_SBERT_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# 动态量化后的 ONNX 模型（导出一次落盘；该文件本身就是“已导出”的标记）
+_FAISS_DIR = Path(__file__).resolve().parents[2] / "data" / "faiss_index"
+_SBERT_ONNX_DIR = _FAISS_DIR / "sbert_onnx"
+_SBERT_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+
+def _load_sbert_onnx_int8() -> Optional[SentenceTransformer]:
+    """
+    CPU 上用 int8 ONNX 后端编码（需要 sentence-transformers>=3.2 + optimum[onnxruntime]）。
+    首次调用时从原模型导出并量化；缺依赖或导出失败返回 None，调用方退回 PyTorch。
+    """
+    try:
+        if not (_SBERT_ONNX_DIR / _SBERT_ONNX_FILE).exists():
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            onnx_model = SentenceTransformer(_SBERT_NAME, backend="onnx")
+            onnx_model.save(str(_SBERT_ONNX_DIR))
+            export_dynamic_quantized_onnx_model(onnx_model, "avx512_vnni", str(_SBERT_ONNX_DIR))
+        return SentenceTransformer(
+            str(_SBERT_ONNX_DIR), backend="onnx", model_kwargs={"file_name": _SBERT_ONNX_FILE}
+        )
+    except Exception:
+        return None
 
 
 def _load_sbert_model() -> SentenceTransformer:
     global _SBERT_MODEL
     if _SBERT_MODEL is None:
-        _SBERT_MODEL = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+        with _SBERT_LOCK:
+            if _SBERT_MODEL is None:
+                _SBERT_MODEL = _load_sbert_onnx_int8() or SentenceTransformer(_SBERT_NAME)
     return _SBERT_MODEL
 
 
 def _auto_corpus_from_topology(limit: int = 500) -> List[str]:
-    ttl_path = Path(__file__).resolve().parents[2] / "data" / "topology.ttl"
-    if not ttl_path.exists():
+    if not topology_store.TTL_PATH.exists():
         return [
             "Room 1205 has three temperature sensors.",
             "Room 2201 has two humidity sensors.",
             "Illuminance sensors measure light intensity."
         ]
-    g = Graph()
-    g.parse(str(ttl_path), format="turtle")
-    return [f"{s} {p} {o}" for s, p, o in g][:limit]
+    g = topology_store.get_graph()
+    # islice：取够 limit 条就停，不把整张图物化成列表再截断
+    return [f"{s} {p} {o}" for s, p, o in islice(g, limit)]
+
+
+def encode(texts: List[str], batch_size: int = 32) -> np.ndarray:
+    """
+    文本的 SBERT 向量（已 L2 归一化，内积即余弦）；检索和 tools.semantic_cache 共用。
+    SBERT 只输出原始向量，L2 归一化交给 faiss.normalize_L2（原地 SIMD 循环），
+    省掉 PyTorch 侧逐 batch 的归一化后处理。返回 C 连续的 float32 (N, d)。
+    """
+    emb = _load_sbert_model().encode(
+        texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=False
+    )
+    emb = np.ascontiguousarray(emb, dtype=np.float32)
+    faiss.normalize_L2(emb)
+    return emb
+
+
+def _build_index(embeddings: np.ndarray) -> faiss.Index:
+    """
+    int8 标量量化的内积索引：每维 1 字节，扫描带宽和落盘体积都是 FlatIP 的 1/4，
+    召回几乎不变。SQ8 只需按维度统计取值范围，train 很快。
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    index = faiss.IndexScalarQuantizer(
+        embeddings.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def _ubinary(embeddings: np.ndarray) -> np.ndarray:
+    """等价于 sentence_transformers.quantization.quantize_embeddings(..., "ubinary")：>0 记 1 后按位打包"""
+    return np.packbits(np.asarray(embeddings) > 0, axis=-1)
+
+
+def _read_index(path: Path, binary: bool = False):
+    """
+    以 mmap 只读方式打开索引：页按需载入，多个 worker 进程共享同一份物理内存。
+    当前 faiss 版本/索引类型不支持 mmap 时退回普通读取。
+    """
+    reader = faiss.read_index_binary if binary else faiss.read_index
+    flags = getattr(faiss, "IO_FLAG_MMAP", 0) | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+    if flags:
+        try:
+            return reader(str(path), flags)
+        except Exception:
+            pass
+    return reader(str(path))
+
+
+def _load_binary_rerank(base_dir: Path, embeddings: np.ndarray, rebuild: bool = False) -> None:
+    """
+    准备二值索引 index_binary.faiss，并把 fp16 向量挂到 _FAISS_EMB 供精排。
+    rebuild=True（向量刚重新生成）或文件缺失/条数不符时重新生成；失败则关闭这条路径，
+    search 退回浮点索引。
+    """
+    global _FAISS_BINARY, _FAISS_EMB
+    bin_path = base_dir / "index_binary.faiss"
+    try:
+        binary = None
+        if not rebuild and bin_path.exists():
+            binary = _read_index(bin_path, binary=True)
+            if binary.ntotal != embeddings.shape[0]:
+                binary = None
+        if binary is None:
+            packed = _ubinary(embeddings)
+            binary = faiss.IndexBinaryFlat(packed.shape[1] * 8)
+            binary.add(packed)
+            tmp = bin_path.with_suffix(".faiss.tmp")
+            faiss.write_index_binary(binary, str(tmp))
+            os.replace(tmp, bin_path)
+        _FAISS_BINARY = binary
+        _FAISS_EMB = embeddings
+    except Exception:
+        _FAISS_BINARY = _FAISS_EMB = None
 
 
-def _load_faiss_index() -> faiss.IndexFlatIP:
-    global _FAISS_INDEX, _FAISS_TEXTS
-    if _FAISS_INDEX is not None:
-        return _FAISS_INDEX
+def _vectors_from_index(index_path: Path, n: int) -> Optional[np.ndarray]:
+    """
+    从仓库自带的 index.faiss（归一化向量的 FlatIP）还原出 (n, d) float32 向量，省掉首次启动时的整份 SBERT 编码；
+    文件缺失、条数与语料不符或索引不支持 reconstruct 时返回 None。
+    """
+    if not index_path.exists():
+        return None
+    try:
+        index = faiss.read_index(str(index_path))
+        if index.ntotal != n:
+            return None
+        return np.ascontiguousarray(index.reconstruct_n(0, n), dtype=np.float32)
+    except Exception:
+        return None
+
 
-    base_dir = Path(__file__).resolve().parents[2] / "data" / "faiss_index"
-    index_path = base_dir / "index.faiss"
+def _save_fp16(path: Path, embeddings: np.ndarray) -> np.ndarray:
+    """归一化向量以 fp16 落盘（体积减半，内积精度对检索排序无影响），返回其只读 mmap"""
+    # 先写临时文件再 os.replace：别的线程/进程已经 mmap 的旧文件保留原 inode，不会被截断
+    tmp = path.with_suffix(".npy.tmp")
+    with tmp.open("wb") as f:
+        np.save(f, np.asarray(embeddings, dtype=np.float16))
+    os.replace(tmp, path)
+    return np.load(path, mmap_mode="r")
+
+
+def _load_faiss_index() -> Tuple[List[str], np.ndarray]:
+    """返回 (语料, fp16 向量)；进程内只加载一次，并发调用时其余线程等第一个线程建完"""
+    global _FAISS_STATE
+    if _FAISS_STATE is None:
+        with _INDEX_LOCK:
+            if _FAISS_STATE is None:
+                _FAISS_STATE = _init_faiss_index()
+    return _FAISS_STATE
+
+
+def _float_index(embeddings: np.ndarray) -> faiss.Index:
+    """二值精排路径不可用时才用的浮点索引：第一次用到时才由向量上转 fp32 现建"""
+    global _FAISS_FLOAT
+    if _FAISS_FLOAT is None:
+        with _INDEX_LOCK:
+            if _FAISS_FLOAT is None:
+                _FAISS_FLOAT = _build_index(np.asarray(embeddings, dtype=np.float32))
+    return _FAISS_FLOAT
+
+
+def _init_faiss_index() -> Tuple[List[str], np.ndarray]:
+    """
+    加载或首次生成向量与二值索引，返回 (语料, fp16 向量)。
+    仓库自带语料 texts.json 和对应的 index.faiss；首次启动从 index.faiss 还原向量，
+    转存成 fp16 的 emb_fp16.npy（外加二值索引），这两个派生文件不入库。
+    """
+    base_dir = _FAISS_DIR
     text_path = base_dir / "texts.json"
+    emb_path = base_dir / "emb_fp16.npy"
 
-    model = _load_sbert_model()
     if not base_dir.exists():
         base_dir.mkdir(parents=True, exist_ok=True)
 
-    if index_path.exists() and text_path.exists():
-        _FAISS_TEXTS = json.loads(text_path.read_text(encoding="utf-8"))
-        _FAISS_INDEX = faiss.read_index(str(index_path))
-        return _FAISS_INDEX
-
-    corpus = _auto_corpus_from_topology()
-    _FAISS_TEXTS = corpus
-    embeddings = model.encode(corpus, convert_to_numpy=True, normalize_embeddings=True)
-    _FAISS_INDEX = faiss.IndexFlatIP(embeddings.shape[1])
-    _FAISS_INDEX.add(embeddings)
-    faiss.write_index(_FAISS_INDEX, str(index_path))
-    text_path.write_text(json.dumps(corpus, ensure_ascii=False, indent=2), encoding="utf-8")
-    return _FAISS_INDEX
-
-
-def search(question: str, k: int = 5) -> List[Dict]:
-    index = _load_faiss_index()
-    model = _load_sbert_model()
-    q_emb = model.encode([question], convert_to_numpy=True, normalize_embeddings=True)
-    D, I = index.search(q_emb, k)
-    return [{"text": _FAISS_TEXTS[idx], "score": float(score)}
-            for idx, score in zip(I[0], D[0]) if idx < len(_FAISS_TEXTS)]
+    texts = json.loads(text_path.read_bytes()) if text_path.exists() else None
+    embeddings = None
+    fresh = False
+    if texts is not None:
+        if emb_path.exists():
+            embeddings = np.load(emb_path, mmap_mode="r")
+            if embeddings.shape[0] != len(texts):
+                embeddings = None
+        if embeddings is None:
+            # 还没有 fp16 向量：优先从 index.faiss 还原，还原不了才用 SBERT 编码整份语料
+            vectors = _vectors_from_index(base_dir / "index.faiss", len(texts))
+            embeddings = _save_fp16(
+                emb_path, vectors if vectors is not None else encode(texts)
+            )
+            fresh = True
+    else:
+        texts = _auto_corpus_from_topology()
+        embeddings = _save_fp16(
+            emb_path, encode(texts)
+        )
+        text_path.write_text(json.dumps(texts, ensure_ascii=False, indent=2), encoding="utf-8")
+        fresh = True
+
+    _load_binary_rerank(base_dir, embeddings, rebuild=fresh)
+    return texts, embeddings
+
+
+def search(question: Union[str, List[str]], k: int = 5) -> Union[List[Dict], List[List[Dict]]]:
+    """
+    传入单个问题返回 List[Dict]；传入问题列表返回与之对齐的 List[List[Dict]]。
+    多个问题时只做一次 SBERT 前向和一次 index.search，Faiss 会在查询间并行。
+    """
+    if isinstance(question, str):
+        return search_batch([question], k)[0]
+    return search_batch(list(question), k)
+
+
+def search_batch(questions: List[str], k: int = 5) -> List[List[Dict]]:
+    if not questions:
+        return []
+    texts, embeddings = _load_faiss_index()
+    q_emb = encode(questions)
+    if _FAISS_BINARY is not None:
+        return _search_binary_rerank(q_emb, k, texts)
+    D, I = _float_index(embeddings).search(q_emb, k)
+    return [
+        [{"text": texts[idx], "score": float(score)}
+         for idx, score in zip(ids, scores) if 0 <= idx < len(texts)]
+        for ids, scores in zip(I, D)
+    ]
+
+
+def _search_binary_rerank(q_emb: np.ndarray, k: int, texts: List[str]) -> List[List[Dict]]:
+    """汉明距离取 k*_RERANK_OVERSAMPLE 个候选，再只对候选行算精确 fp32 内积排序"""
+    n_cand = min(len(texts), k * _RERANK_OVERSAMPLE)
+    _, C = _FAISS_BINARY.search(_ubinary(q_emb), n_cand)
+    results = []
+    for q, ids in zip(q_emb, C):
+        ids = ids[ids >= 0]
+        scores = _FAISS_EMB[ids].astype(np.float32) @ q
+        top = np.argsort(-scores, kind="stable")[:k]
+        results.append([{"text": texts[ids[j]], "score": float(scores[j])} for j in top])
+    return results
 
 
 def build_context(chunks: List[Dict]) -> str:
@@ -285,19 +618,3 @@ SELECT ?room ?pt ?ptType ?tsid WHERE {
         return _clean_sparql_response(sparql)
     except Exception:
         return "SELECT ?s ?p ?o WHERE { ?s ?p ?o } LIMIT 20"
-
-
-def _clean_sparql_response(sparql: str) -> str:
-    sparql = sparql.strip()
-    for block in ["```sparql", "```sql", "```"]:
-        if block in sparql:
-            parts = sparql.split(block)
-            if len(parts) >= 2:
-                sparql = parts[1].split("```")[0].strip()
-                break
-
-    if "PREFIX brick:" not in sparql:
-        basic_prefixes = "PREFIX brick: <https://brickschema.org/schema/Brick#>\nPREFIX ref: <https://brickschema.org/schema/Brick/ref#>\nPREFIX bldg: <urn:demo-building#>"
-        sparql = f"{basic_prefixes}\n\n{sparql}"
-
-    return sparql
\ No newline at end of file
@@ -1,16 +1,21 @@
 from __future__ import annotations
 import re
 import json
+import threading
+from collections import OrderedDict
 from typing import Dict, Optional, List
 from functools import lru_cache
+try:
+    import ahocorasick  # 可选：pyahocorasick，多关键词一次线性扫描
+except ImportError:
+    ahocorasick = None
+from nodes.sparql_util import (
+    BRICK_PREFIX, REF_PREFIX, BLDG_PREFIX,
+    ALL_PREFIX as _ALL_PREFIX,
+    clean_sparql_response as _clean_sparql_response,
+)
 
 # ============ 常量定义 ============
-BRICK_PREFIX = "PREFIX brick: <https://brickschema.org/schema/Brick#>"
-REF_PREFIX = "PREFIX ref:   <https://brickschema.org/schema/Brick/ref#>"
-BLDG_PREFIX = "PREFIX bldg:  <urn:demo-building#>"
-
-_ALL_PREFIX = "\n".join([BRICK_PREFIX, REF_PREFIX, BLDG_PREFIX])
-
 # 传感器类型映射
 _METRIC_TO_TYPES = {
     "temp": ["brick:Air_Temperature_Sensor"],
@@ -19,6 +24,12 @@ _METRIC_TO_TYPES = {
     "co2": ["brick:CO2_Level_Sensor"],
     "pm25": ["brick:PM2.5_Sensor"],
 }
+# 不指定指标时的全集，以及各 VALUES 约束块：导入时生成一次，模板里直接查表
+_ALL_METRIC_TYPES = tuple(t for types in _METRIC_TO_TYPES.values() for t in types)
+_VALUES_ALL = f"VALUES ?ptType {{ {' '.join(_ALL_METRIC_TYPES)} }}"
+_VALUES_BY_METRIC = {
+    m: f"VALUES ?ptType {{ {' '.join(types)} }}" for m, types in _METRIC_TO_TYPES.items()
+}
 
 # 关键词到指标的映射
 _KEYWORD_TO_METRIC = {
@@ -28,6 +39,21 @@ _KEYWORD_TO_METRIC = {
     "rh": ["湿度", "humidity", "rh"],
     "lux": ["照度", "光照", "illuminance", "lux"]
 }
+# 多个指标同时命中时按上表顺序取第一个（与逐个 in 判断的结果一致）
+_METRIC_PRIORITY = {m: i for i, m in enumerate(_KEYWORD_TO_METRIC)}
+if ahocorasick is not None:
+    _KEYWORD_AC = ahocorasick.Automaton()
+    for _m, _kws in _KEYWORD_TO_METRIC.items():
+        for _kw in _kws:
+            _KEYWORD_AC.add_word(_kw, _m)
+    _KEYWORD_AC.make_automaton()
+    del _m, _kws, _kw
+else:
+    _KEYWORD_AC = None
+
+
+# 房间号：1~4 位独立数字
+_ROOM_RE = re.compile(r"(?<!\d)(\d{1,4})(?!\d)")
 
 
 # ============ 核心工具函数 ============
@@ -36,13 +62,12 @@ def _get_metric_types(metric: Optional[str]) -> List[str]:
     if metric and metric in _METRIC_TO_TYPES:
         return _METRIC_TO_TYPES[metric]
     # 默认返回所有传感器类型
-    return [item for sublist in _METRIC_TO_TYPES.values() for item in sublist]
+    return list(_ALL_METRIC_TYPES)
 
 
 def _values_pt_types(metric: Optional[str]) -> str:
     """生成SPARQL VALUES约束块"""
-    types = _get_metric_types(metric)
-    return f"VALUES ?ptType {{ {' '.join(types)} }}"
+    return _VALUES_BY_METRIC.get(metric, _VALUES_ALL) if metric else _VALUES_ALL
 
 
 def _room_filter(room_no: str) -> str:
@@ -52,43 +77,32 @@ def _room_filter(room_no: str) -> str:
 
 def _extract_room_from_text(text: str) -> Optional[str]:
     """从文本中提取房间号"""
-    match = re.search(r"(?<!\d)(\d{1,4})(?!\d)", text or "")
+    match = _ROOM_RE.search(text or "")
     return match.group(1) if match else None
 
 
 def _infer_metric_from_text(text: str) -> Optional[str]:
     """从文本中推断指标类型"""
     text_lower = (text or "").lower()
+    if _KEYWORD_AC is not None:
+        hits = {metric for _, metric in _KEYWORD_AC.iter(text_lower)}
+        return min(hits, key=_METRIC_PRIORITY.__getitem__) if hits else None
     for metric, keywords in _KEYWORD_TO_METRIC.items():
         if any(keyword in text_lower for keyword in keywords):
             return metric
     return None
 
 
-def _clean_sparql_response(sparql: str) -> str:
-    """清理LLM返回的SPARQL响应"""
-    sparql = sparql.strip()
-
-    # 移除代码块标记
-    for marker in ["```sparql", "```sql", "```"]:
-        if marker in sparql:
-            parts = sparql.split(marker)
-            if len(parts) >= 2:
-                sparql = parts[1].split("```")[0].strip()
-                break
-
-    # 确保必要的PREFIX
-    if "PREFIX brick:" not in sparql:
-        sparql = f"{_ALL_PREFIX}\n\n{sparql}"
-
-    return sparql
-
-
 # ============ 查询模板 ============
 class SPARQLTemplates:
-    """SPARQL查询模板集合"""
+    """
+    SPARQL查询模板集合。
+    参数组合有限（房间号 × 指标），生成结果按参数缓存；同一条查询文本在
+    sparql_exec 里也只会被 rdflib 解析一次（prepareQuery 缓存）。
+    """
 
     @staticmethod
+    @lru_cache(maxsize=64)
     def room_points_tsid(room_no: str, metric: Optional[str]) -> str:
         """查询指定房间的传感器点位和时序ID"""
         return f"""{_ALL_PREFIX}
@@ -110,6 +124,7 @@ LIMIT 50
 """.strip()
 
     @staticmethod
+    @lru_cache(maxsize=64)
     def list_points_any(limit: int = 20) -> str:
         """列出所有点位（兜底查询）"""
         return f"""{_ALL_PREFIX}
@@ -130,6 +145,7 @@ LIMIT {limit}
 """.strip()
 
     @staticmethod
+    @lru_cache(maxsize=64)
     def count_rooms() -> str:
         """统计房间数量"""
         return f"""{_ALL_PREFIX}
@@ -141,6 +157,7 @@ WHERE {{
 """.strip()
 
     @staticmethod
+    @lru_cache(maxsize=64)
     def list_rooms() -> str:
         """列出所有房间"""
         return f"""{_ALL_PREFIX}
@@ -153,6 +170,7 @@ ORDER BY ?room
 """.strip()
 
     @staticmethod
+    @lru_cache(maxsize=64)
     def sensor_existence(room: Optional[str], metric: Optional[str]) -> str:
         """查询传感器存在性"""
         room_condition = _room_filter(room) if room else "?room a brick:Room ."
@@ -214,10 +232,18 @@ class SPARQLGenerator:
 
 # ============ LLM回退生成器 ============
 class LLMSPARQLGenerator:
-    """基于LLM的SPARQL回退生成器"""
+    """
+    基于LLM的SPARQL回退生成器。
+    提示词只由问题和 hints 决定（temperature=0），同一提示词的生成结果按 LRU 缓存：
+    0 行回退里第二级失败再退回第一级时，不会把同一个请求再发一遍给 LLM。
+    """
+
+    _CACHE_MAX = 128
 
     def __init__(self):
         self._llm = None
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
 
     @lru_cache(maxsize=1)
     def _get_llm(self):
@@ -279,11 +305,24 @@ PREFIX bldg:  <urn:demo-building#>
 
         try:
             prompt = self._build_prompt(question, hints)
+            with self._lock:
+                cached = self._cache.get(prompt)
+                if cached is not None:
+                    self._cache.move_to_end(prompt)
+            if cached is not None:
+                print(f"[SPARQL-LEVEL1] 复用已生成的查询: {cached}")
+                return cached
+
             response = llm.invoke(prompt)
             sparql = response.content if hasattr(response, 'content') else str(response)
 
             cleaned_sparql = _clean_sparql_response(sparql)
             print(f"[SPARQL-LEVEL1] 第一级回退生成查询: {cleaned_sparql}")
+            if cleaned_sparql:
+                with self._lock:
+                    self._cache[prompt] = cleaned_sparql
+                    if len(self._cache) > self._CACHE_MAX:
+                        self._cache.popitem(last=False)
             return cleaned_sparql
 
         except Exception as e:
@@ -305,7 +344,3 @@ def generate(question: str, context: str = "", hints: Dict | None = None) -> str
 def llm_based_sparql_generation(question: str, context: str = "", hints: Dict | None = None) -> str:
     """回退接口：使用LLM生成SPARQL查询"""
     return _llm_generator.generate(question, context, hints)
-
-
-# 保持向后兼容的别名
-_clean_sparql_response = _clean_sparql_response
\ No newline at end of file
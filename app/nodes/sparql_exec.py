@@ -1,32 +1,32 @@
 # app/nodes/sparql_exec.py
 from __future__ import annotations
-from pathlib import Path
-from typing import List, Dict, Any
-import time
-from rdflib import Graph
+from typing import List, Dict, Any, Optional, Tuple
+import os, re, time
+from functools import lru_cache
+from rdflib import Graph, Literal
+from rdflib.plugins.sparql import prepareQuery
+from nodes.topology_store import TTL_PATH, get_graph, get_oxigraph_store
 
-# 路径：优先绝对，退回相对
-ABS = Path(r"F:\Task\RAG-LangGraph-Demo\data\topology.ttl")
-REL = Path(__file__).resolve().parents[2] / "data" / "topology.ttl"
-TTL_PATH = ABS if ABS.exists() else REL
-
-_RDF: Graph | None = None
+# 查询后端：默认有 pyoxigraph 就用它；SPARQL_BACKEND=rdflib 强制走 rdflib
+SPARQL_BACKEND = os.environ.get("SPARQL_BACKEND", "oxigraph").strip().lower()
 
 def _get_graph() -> Graph:
-    global _RDF
-    if _RDF is None:
-        g = Graph()
-        g.parse(str(TTL_PATH), format="turtle")
-        _RDF = g
-    return _RDF
+    # 与 rag_agent 共用 topology_store 里缓存的同一个 Graph
+    return get_graph()
+
+_BRACKET_RE = re.compile(r"[(){}\[\]]")
 
 # === A-CHANGE === 最小语法校验：括号匹配 + PREFIX 粗检
 def _basic_syntax_check(q: str) -> bool:
     if not q or not isinstance(q, str):
         return False
+    # 快路径：三类括号数量不等必然不匹配（str.count 是 C 层扫描）
+    if q.count("(") != q.count(")") or q.count("{") != q.count("}") or q.count("[") != q.count("]"):
+        return False
+    # 数量相等时仍要校验嵌套顺序，但只遍历抽出来的括号字符，不再逐字符走全文
     pairs = {"(": ")", "{": "}", "[": "]"}
     stack = []
-    for ch in q:
+    for ch in _BRACKET_RE.findall(q):
         if ch in pairs:
             stack.append(ch)
         elif ch in pairs.values():
@@ -44,36 +44,110 @@ def _basic_syntax_check(q: str) -> bool:
         return False
     return True
 
-def _norm_row(item: Dict[str, Any]) -> Dict[str, Any]:
-    out: Dict[str, Any] = {}
-    for k, v in item.items():
-        out[str(k)] = str(v)  # 值统一为字符串
-    # 统一 tsid 字段名
-    if "tsid" not in out and "ts_id" in out:
-        out["tsid"] = out["ts_id"]
-    return out
+def _norm_row(row: Dict[str, str]) -> Dict[str, str]:
+    """行在构造时就已是 {变量名: 字符串}；这里只原地统一 tsid 字段名"""
+    if "tsid" not in row and "ts_id" in row:
+        row["tsid"] = row["ts_id"]
+    return row
+
+def _query_oxigraph(query: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    用 pyoxigraph 执行 SELECT；不可用、非 SELECT 结果或执行报错时返回 None，
+    由调用方退回 rdflib（两边语法一致，rdflib 兜底少数特性差异）。
+    """
+    if SPARQL_BACKEND == "rdflib":
+        return None
+    store = get_oxigraph_store()
+    if store is None:
+        return None
+    # 结果是惰性求值的，执行期错误在迭代时才抛出，所以取行也要放在 try 里
+    try:
+        solutions = store.query(query)
+        names = [v.value for v in solutions.variables]
+        # 与 rdflib 路径对齐：IRI/字面量取词法值，未绑定变量得到 "None"
+        return [
+            {name: (term.value if term is not None else "None") for name, term in zip(names, sol)}
+            for sol in solutions
+        ]
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=64)
+def _prepared(query: str):
+    """
+    按查询文本缓存解析好的代数树：模板生成的查询文本是确定的，同一形状只解析一次。
+    依赖 Graph 命名空间（没写 PREFIX）的查询预解析会失败，返回 None 交给 g.query 直接处理。
+    """
+    try:
+        return prepareQuery(query)
+    except Exception:
+        return None
+
+
+# 查询“形状”：把普通字符串字面量换成占位变量、执行时用 initBindings 绑回去，
+# 只差房间号之类字面量的查询共用同一棵解析树（rdflib 解析一次要十几毫秒）
+_STR_LITERAL_RE = re.compile(r'"([^"\\\n]*)"')
+_SELECT_STAR_RE = re.compile(r"SELECT\s+(?:DISTINCT\s+|REDUCED\s+)?\*", re.I)
+
+
+def _shape(query: str) -> Optional[Tuple[str, Dict[str, Literal]]]:
+    """
+    返回 (形状文本, 占位变量绑定)；没有可替换的字面量时返回 None。
+    SELECT * 会把占位变量也投影出来，不走这条路。带语言标签/数据类型、出现在 VALUES 里等
+    替换后不合法的写法，预解析会失败，由调用方退回按原文解析。
+    """
+    if "?__lit" in query or _SELECT_STAR_RE.search(query):
+        return None
+    values: List[str] = []
+
+    def _sub(m: "re.Match[str]") -> str:
+        values.append(m.group(1))
+        return f"?__lit{len(values) - 1}"
+
+    shape = _STR_LITERAL_RE.sub(_sub, query)
+    if not values:
+        return None
+    return shape, {f"__lit{i}": Literal(v) for i, v in enumerate(values)}
+
+
+def _query_rdflib(query: str) -> Optional[List[Dict[str, Any]]]:
+    g = _get_graph()
+    qres = None
+    shaped = _shape(query)
+    if shaped is not None:
+        prepared = _prepared(shaped[0])
+        if prepared is not None:
+            try:
+                qres = g.query(prepared, initBindings=shaped[1])
+            except Exception:
+                qres = None
+    try:
+        if qres is None:
+            qres = g.query(_prepared(query) or query)
+    except Exception:
+        return None
+    vars_ = [str(v) for v in getattr(qres, "vars", [])] or None
+    # 构造行时就把值统一为字符串，每行只分配一个 dict
+    if vars_:
+        return [{name: str(v) for name, v in zip(vars_, r)} for r in qres]
+    return [{f"col{i}": str(v) for i, v in enumerate(r)} for r in qres]
+
 
 def execute(query: str) -> List[Dict[str, Any]]:
     # === A-CHANGE === 先做最小语法校验，失败直接返回 []
     if not _basic_syntax_check(query):
         return []
 
-    g = _get_graph()
     t0 = time.perf_counter()
-    try:
-        qres = g.query(query)
-    except Exception:
+    items = _query_oxigraph(query)
+    if items is None:
+        items = _query_rdflib(query)
+    if items is None:
         return []
     elapsed_ms = int((time.perf_counter() - t0) * 1000)
 
-    vars_ = [str(v) for v in getattr(qres, "vars", [])] or None
-    rows: List[Dict[str, Any]] = []
-    for r in qres:
-        if vars_:
-            item = {vars_[i]: r[i] for i in range(len(vars_))}
-        else:
-            item = {f"col{i}": v for i, v in enumerate(r)}
-        rows.append(_norm_row(item))
+    rows: List[Dict[str, Any]] = [_norm_row(item) for item in items]
 
     if rows:
         rows[0]["__elapsed_ms"] = str(elapsed_ms)
@@ -0,0 +1,36 @@
+# app/nodes/sparql_util.py
+"""
+SPARQL 公共小工具：rag_agent 与 sparql_agent 共用的 PREFIX 常量和 LLM 输出清洗。
+"""
+from __future__ import annotations
+import re
+
+BRICK_PREFIX = "PREFIX brick: <https://brickschema.org/schema/Brick#>"
+REF_PREFIX = "PREFIX ref:   <https://brickschema.org/schema/Brick/ref#>"
+BLDG_PREFIX = "PREFIX bldg:  <urn:demo-building#>"
+
+ALL_PREFIX = "\n".join([BRICK_PREFIX, REF_PREFIX, BLDG_PREFIX])
+
+# 代码块按 ```sparql、```sql、``` 的优先级找：前面有 ```json 之类的块也先取 sparql 的；
+# 取到下一个围栏为止（缺结尾围栏时取到末尾）
+_FENCE_RES = tuple(
+    re.compile(rf"```{tag}(.*?)(?:```|\Z)", re.S) for tag in ("sparql", "sql", "")
+)
+
+
+def clean_sparql_response(sparql: str) -> str:
+    """清理LLM返回的SPARQL响应：去掉代码块标记，缺 PREFIX 时补上"""
+    sparql = sparql.strip()
+
+    # 移除代码块标记
+    for fence_re in _FENCE_RES:
+        m = fence_re.search(sparql)
+        if m:
+            sparql = m.group(1).strip()
+            break
+
+    # 确保必要的PREFIX
+    if "PREFIX brick:" not in sparql:
+        sparql = f"{ALL_PREFIX}\n\n{sparql}"
+
+    return sparql
@@ -0,0 +1,79 @@
+# app/tools/_lsh_numba.py
+"""
+semantic_cache 的可选加速内核（需要 numba）。
+
+hash_vector：sign(W @ v) 逐表按位拼成 uint64 桶号（高位在前，与 NumPy 路径一致）；
+verify_candidates：只在给定的候选行上算余弦，返回 ≥ 阈值的最佳候选下标，没有则 -1。
+显式签名在导入时即编译（cache=True 落盘后只是加载），首个查询不再等类型推断。
+没装 numba 时两者均为 None，调用方自动走纯 NumPy 路径。
+"""
+from __future__ import annotations
+import numpy as np
+
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
+
+def _hash_vector(v, planes, tables, bits):
+    """
+    v:      查询向量 float32 (d,)
+    planes: 随机超平面 float32 (tables * bits, d)
+    返回每张表一个桶号 uint64 (tables,)
+    """
+    d = v.shape[0]
+    keys = np.zeros(tables, dtype=np.uint64)
+    for t in range(tables):
+        key = np.uint64(0)
+        for b in range(bits):
+            row = t * bits + b
+            acc = 0.0
+            for j in range(d):
+                acc += planes[row, j] * v[j]
+            key = (key << np.uint64(1)) | np.uint64(1 if acc > 0.0 else 0)
+        keys[t] = key
+    return keys
+
+
+def _verify_candidates(query, emb, slots, threshold):
+    """
+    query: 查询向量 float32 (d,)
+    emb:   缓存向量矩阵 float32 (capacity, d)
+    slots: 候选所在行号 int64 (m,)
+    返回 slots 中余弦最大且 ≥ threshold 的位置，没有返回 -1。
+    """
+    d = query.shape[0]
+    qn = 0.0
+    for j in range(d):
+        qn += query[j] * query[j]
+    qn = np.sqrt(qn)
+    best = -1
+    best_sim = threshold
+    for i in range(slots.shape[0]):
+        s = slots[i]
+        dot = 0.0
+        en = 0.0
+        for j in range(d):
+            dot += emb[s, j] * query[j]
+            en += emb[s, j] * emb[s, j]
+        denom = qn * np.sqrt(en)
+        if denom == 0.0:
+            continue
+        sim = dot / denom
+        if sim >= best_sim:
+            best = i
+            best_sim = sim
+    return best
+
+
+if njit is not None:
+    hash_vector = njit(
+        "uint64[:](float32[:], float32[:, :], int64, int64)", cache=True, fastmath=True, nogil=True
+    )(_hash_vector)
+    verify_candidates = njit(
+        "int64(float32[:], float32[:, :], int64[:], float64)", cache=True, fastmath=True, nogil=True
+    )(_verify_candidates)
+else:
+    hash_vector = None
+    verify_candidates = None
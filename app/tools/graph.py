@@ -1,5 +1,9 @@
 from __future__ import annotations
-from typing import TypedDict, List, Dict, Any
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TypedDict, List, Dict, Any, Tuple
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 
 from nodes import (
@@ -13,6 +17,20 @@ from nodes import (
 
 USE_RAG = True
 
+# 拓扑类问题要附带的“全部房间”全集：同一栋楼的结果固定不变
+_ALL_ROOMS_SPARQL = """
+PREFIX brick: <https://brickschema.org/schema/Brick#>
+PREFIX bldg:  <urn:demo-building#>
+
+SELECT DISTINCT ?room
+WHERE {
+  ?room a brick:Room .
+}
+ORDER BY ?room
+""".strip()
+# 全集还没缓存时，让它和用户查询并发跑（单线程池，常驻复用）
+_ALL_ROOMS_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="all-rooms")
+
 
 class State(TypedDict, total=False):
     question: str
@@ -23,17 +41,23 @@ class State(TypedDict, total=False):
     hints: Dict[str, Any]
     time_window: Dict[str, Any]
     context: str
+    rag_chunks: List[Dict[str, Any]]
     sparql: str
+    # 未在这里声明的键，LangGraph 合并节点返回值时会直接丢弃
+    sparql_history: List[Tuple[str, str]]
+    fallback_strategy: str
     rows: List[Dict[str, Any]]
     analysis: List[Dict[str, Any]]
     analysis_error: str
     answer: str
     trace: List[str]
     topology_all_rooms: List[Dict[str, Any]]
+    route_after_execute: str
 
 
 def node_intent(state: State) -> State:
-    state.setdefault("trace", []).append("intent")
+    # 入口节点：trace 在这里建好，下游节点直接 append
+    state["trace"] = ["intent"]
     try:
         state["hints"] = rag_agent.get_hints(state["question"])
         state["need_stats"] = bool(rag_agent.need_stats(state["question"]))
@@ -41,27 +65,75 @@ def node_intent(state: State) -> State:
         state["hints"] = {}
         state["need_stats"] = False
 
+    state["route_after_execute"] = _route_from_hints(state["hints"], state["need_stats"])
     state["retries"] = 0
     state["max_retries"] = 1
     return state
 
 
-def node_rag(state: State) -> State:
-    state.setdefault("trace", []).append("rag")
+def _route_from_hints(hints: Dict[str, Any], need_stats: bool) -> str:
+    """
+    有结果行时 execute_sparql 之后去哪，只取决于 hints 和 need_stats：
+    入口节点算一次存进 state，route_after_execute 直接读。
+    """
+    hints = hints or {}
+    time_range = hints.get("time_range") or {}
+    need = hints.get("need")
+    need_ok = isinstance(need, list) and len(need) > 0
+
+    if hints.get("question_type") == "topology":
+        return "answer"
+    if time_range.get("kind") == "point_in_time":
+        return "analyze_point_in_time"
+    if need_stats or need_ok:
+        return "analyze"
+    return "answer"
+
+
+async def anode_intent_and_rag(state: State) -> State:
+    """
+    intent 与 rag 之间没有数据依赖：LLM 解析（网络等待）和 Faiss 检索（线程里跑）并发，
+    检索耗时被 LLM 往返盖住。need_stats 直接取 hints 里的字段，不再单独解析一次。
+    """
+    # 入口节点：trace 在这里建好，下游节点直接 append
+    state["trace"] = ["intent", "rag"]
+    q = state["question"]
+    hints, chunks = await asyncio.gather(
+        rag_agent.allm_parse(q), asyncio.to_thread(rag_agent.search, q),
+        return_exceptions=True,
+    )
+
+    if isinstance(hints, BaseException):
+        state["hints"] = {}
+        state["need_stats"] = False
+    else:
+        state["hints"] = hints
+        state["need_stats"] = bool(hints.get("need_stats"))
+    state["route_after_execute"] = _route_from_hints(state["hints"], state["need_stats"])
+    state["retries"] = 0
+    state["max_retries"] = 1
+
     try:
-        chunks = rag_agent.search(state["question"])
+        if isinstance(chunks, BaseException):
+            raise chunks
         state["context"] = rag_agent.build_context(chunks)
+        state["rag_chunks"] = chunks  # 第二级回退直接复用，不再重新编码、检索
     except Exception:
         state["context"] = ""
     return state
 
 
+def node_intent_and_rag(state: State) -> State:
+    # 同步 agent.invoke 走这里：本线程内起一个事件循环跑同一个协程
+    return asyncio.run(anode_intent_and_rag(state))
+
+
 def node_normalize_time(state: State) -> State:
     return normalize_time_agent.node_normalize_time(state)
 
 
 def node_generate_sparql(state: State) -> State:
-    state.setdefault("trace", []).append("generate_sparql")
+    state["trace"].append("generate_sparql")
 
     # 如果已有SPARQL（来自回退），直接返回
     if state.get("sparql"):
@@ -87,7 +159,14 @@ def node_generate_sparql(state: State) -> State:
 
 
 def node_execute_sparql(state: State) -> State:
-    state.setdefault("trace", []).append("execute_sparql")
+    state["trace"].append("execute_sparql")
+
+    # 拓扑类问题还需要所有房间：缓存未命中时先提交到后台，与用户查询同时执行
+    hints = state.get("hints", {}) or {}
+    is_topology = hints.get("question_type") == "topology"
+    rooms_future = None
+    if is_topology and _get_all_rooms.cache_info().currsize == 0:
+        rooms_future = _ALL_ROOMS_POOL.submit(_get_all_rooms)
 
     try:
         rows = sparql_exec.execute(state.get("sparql", "")) or []
@@ -97,64 +176,74 @@ def node_execute_sparql(state: State) -> State:
     state["rows"] = rows
     state["have_rows"] = bool(rows)
 
-    # 拓扑类问题获取所有房间
-    hints = state.get("hints", {}) or {}
-    if hints.get("question_type") == "topology":
+    if is_topology:
         try:
-            all_rooms_sparql = """
-PREFIX brick: <https://brickschema.org/schema/Brick#>
-PREFIX bldg:  <urn:demo-building#>
-
-SELECT DISTINCT ?room
-WHERE {
-  ?room a brick:Room .
-}
-ORDER BY ?room
-""".strip()
-            all_rooms_rows = sparql_exec.execute(all_rooms_sparql) or []
-            state["topology_all_rooms"] = all_rooms_rows
+            all_rooms = rooms_future.result() if rooms_future is not None else _get_all_rooms()
+            # 每次请求拿新的 dict，下游改行不会串到后续请求
+            state["topology_all_rooms"] = [dict(items) for items in all_rooms]
         except Exception:
             state["topology_all_rooms"] = []
 
     return state
 
 
+@lru_cache(maxsize=1)
+def _get_all_rooms() -> Tuple[Tuple[Tuple[str, Any], ...], ...]:
+    """
+    全部房间只查一次；拓扑数据更新后调用 invalidate_topology_cache()。
+    缓存成不可变的 (键, 值) 元组，去掉首行那次查询的 __elapsed_ms（对后续请求没有意义）。
+    """
+    rows = sparql_exec.execute(_ALL_ROOMS_SPARQL)
+    if not rows:
+        # 空结果多半是执行出错：抛出去不让 lru_cache 记住，下次重试
+        raise RuntimeError("all-rooms query returned no rows")
+    return tuple(tuple((k, v) for k, v in r.items() if k != "__elapsed_ms") for r in rows)
+
+
+def invalidate_topology_cache() -> None:
+    _get_all_rooms.cache_clear()
+
+
 def node_route_zero_rows(state: State) -> State:
-    state.setdefault("trace", []).append("route_zero_rows")
+    state["trace"].append("route_zero_rows")
     current_retries = int(state.get("retries", 0))
     state["retries"] = current_retries + 1
     retry_count = current_retries + 1
+    question = state.get("question", "")
+    hints = state.get("hints", {})
 
     try:
         if retry_count == 1:
             # 第一级回退：LLM生成SPARQL
             state["sparql"] = sparql_agent.llm_based_sparql_generation(
-                state.get("question", ""),
+                question,
                 context=state.get("context", ""),
-                hints=state.get("hints", {})
+                hints=hints
             )
             state["fallback_strategy"] = "level_1"
 
         elif retry_count == 2:
             # 第二级回退：RAG增强
             try:
-                chunks = rag_agent.search(state.get("question", ""))
+                chunks = state.get("rag_chunks")
+                if chunks is None:
+                    chunks = rag_agent.search(question)
                 new_context = rag_agent.build_context(chunks)
                 state["context"] = new_context
 
                 state["sparql"] = rag_agent.advanced_text_to_sparql(
-                    state.get("question", ""),
+                    question,
                     retrieved_context=new_context,
-                    hints=state.get("hints", {})
+                    hints=hints
                 )
                 state["fallback_strategy"] = "level_2"
 
             except Exception as e:
                 # RAG增强失败，回退到第一级
                 state["sparql"] = sparql_agent.llm_based_sparql_generation(
-                    state.get("question", ""),
+                    question,
                     context=state.get("context", ""),
-                    hints=state.get("hints", {})
+                    hints=hints
                 )
                 state["fallback_strategy"] = "level_1_fallback"
 
@@ -171,7 +260,7 @@ def node_route_zero_rows(state: State) -> State:
 
 
 def node_analyze_point_in_time(state: State) -> State:
-    state.setdefault("trace", []).append("analyze_point_in_time")
+    state["trace"].append("analyze_point_in_time")
     try:
         state["analysis"] = analysis_agent.analyze_point_in_time_state(state)
         state["analysis_error"] = None
@@ -182,7 +271,7 @@ def node_analyze_point_in_time(state: State) -> State:
 
 
 def node_analyze(state: State) -> State:
-    state.setdefault("trace", []).append("analyze")
+    state["trace"].append("analyze")
     try:
         if hasattr(analysis_agent, "analyze_state"):
             state["analysis"] = analysis_agent.analyze_state(state)
@@ -198,7 +287,7 @@ def node_analyze(state: State) -> State:
 
 
 def node_answer(state: State) -> State:
-    state.setdefault("trace", []).append("answer")
+    state["trace"].append("answer")
     try:
         state["answer"] = answer_agent.compose(
             user_query=state["question"],
@@ -214,25 +303,12 @@ def node_answer(state: State) -> State:
 
 
 def route_after_execute(state: State) -> str:
-    hints = state.get("hints", {}) or {}
-    qtype = hints.get("question_type")
-    time_range = hints.get("time_range", {})
-    need = hints.get("need")
-    need_ok = isinstance(need, list) and len(need) > 0
-
     if not state.get("have_rows"):
         return "zero"
-
-    if qtype == "topology":
-        return "answer"
-
-    if time_range.get("kind") == "point_in_time":
-        return "analyze_point_in_time"
-
-    if state.get("need_stats") or need_ok:
-        return "analyze"
-
-    return "answer"
+    route = state.get("route_after_execute")
+    if route is None:
+        route = _route_from_hints(state.get("hints", {}), bool(state.get("need_stats")))
+    return route
 
 
 def route_retry_or_end(state: State) -> str:
@@ -245,8 +321,13 @@ def route_retry_or_end(state: State) -> str:
 # 构建工作流
 workflow = StateGraph(State)
 
-workflow.add_node("intent", node_intent)
-workflow.add_node("rag", node_rag)
+if USE_RAG:
+    # 同时给出同步/异步实现：invoke 和 ainvoke 都能跑这个节点
+    workflow.add_node(
+        "intent_and_rag", RunnableLambda(node_intent_and_rag, afunc=anode_intent_and_rag)
+    )
+else:
+    workflow.add_node("intent", node_intent)
 workflow.add_node("normalize_time", node_normalize_time)
 workflow.add_node("generate_sparql", node_generate_sparql)
 workflow.add_node("execute_sparql", node_execute_sparql)
@@ -255,12 +336,11 @@ workflow.add_node("analyze", node_analyze)
 workflow.add_node("answer", node_answer)
 workflow.add_node("analyze_point_in_time", node_analyze_point_in_time)
 
-workflow.set_entry_point("intent")
-
 if USE_RAG:
-    workflow.add_edge("intent", "rag")
-    workflow.add_edge("rag", "normalize_time")
+    workflow.set_entry_point("intent_and_rag")
+    workflow.add_edge("intent_and_rag", "normalize_time")
 else:
+    workflow.set_entry_point("intent")
     workflow.add_edge("intent", "normalize_time")
 
 workflow.add_edge("normalize_time", "generate_sparql")
@@ -0,0 +1,179 @@
+# app/tools/semantic_cache.py
+"""
+问句级语义缓存：同一会话里换个说法再问一遍，直接复用上次的整图结果，
+不再跑 intent → RAG → SPARQL → LLM 整条流水线。
+
+- 问句用 rag_agent 的 SBERT 编码（已 L2 归一化，内积即余弦）；
+- 随机投影 LSH：L 张表，每张 k 位符号哈希 sign(W @ v)，按位拼成 uint64 桶号；
+  只对落在同一桶里的候选算余弦，≥ 阈值才算命中（装了 numba 时两步都走 _lsh_numba 内核）；
+- 余弦再高也分不清“301”和“302”、“温度”和“湿度”、“昨天”和“前天”、“平均”和“最高”，
+  所以问句里的数字串、推断出的指标、相对时间词和聚合词必须完全一致；
+  相对时间按当天解析，所以日期变了整个缓存作废。
+"""
+from __future__ import annotations
+import copy
+import re
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+
+from nodes import rag_agent
+from nodes.sparql_agent import _infer_metric_from_text
+from tools._lsh_numba import hash_vector as _hash_vector_jit, verify_candidates as _verify_jit
+
+_DIGITS_RE = re.compile(r"\d+")
+
+# 相对时间 / 时间单位 / 聚合方式的同义词 -> 规范记号；只比较记号，不比较原词
+_SIGNATURE_TOKENS: Dict[str, Tuple[str, ...]] = {
+    "today": ("今天", "今日", "today"),
+    "day-1": ("昨天", "昨日", "yesterday"),
+    "day-2": ("前天", "the day before yesterday"),
+    "day-3": ("大前天",),
+    "this_week": ("本周", "这周", "这个星期", "this week"),
+    "last_week": ("上周", "上个星期", "上星期", "last week"),
+    "this_month": ("本月", "这个月", "this month"),
+    "last_month": ("上个月", "上月", "last month"),
+    "morning": ("早上", "上午", "morning"),
+    "afternoon": ("下午", "afternoon"),
+    "evening": ("晚上", "夜里", "evening", "night"),
+    "unit_min": ("分钟", "minute", "minutes"),
+    "unit_hour": ("小时", "hour", "hours"),
+    "unit_day": ("天", "day", "days"),
+    "avg": ("平均", "均值", "average", "avg", "mean"),
+    "max": ("最高", "最大", "峰值", "maximum", "max", "highest", "peak"),
+    "min": ("最低", "最小", "minimum", "min", "lowest"),
+    "trend": ("趋势", "变化", "trend"),
+}
+_TOKEN_OF = {word: token for token, words in _SIGNATURE_TOKENS.items() for word in words}
+# 长词优先（“大前天”先于“前天”，“the day before yesterday”先于“yesterday”）；英文词要求整词
+_TOKEN_RE = re.compile("|".join(
+    re.escape(w) if not w.isascii() else rf"\b{re.escape(w)}\b"
+    for w in sorted(_TOKEN_OF, key=len, reverse=True)
+))
+
+
+def _signature(question: str) -> Tuple[Tuple[str, ...], Optional[str], Tuple[str, ...]]:
+    """语义相近但答案不同的关键要素：数字串（房间号/日期/时刻）+ 指标 + 相对时间/聚合记号"""
+    tokens = tuple(sorted({_TOKEN_OF[m] for m in _TOKEN_RE.findall(question.lower())}))
+    return tuple(_DIGITS_RE.findall(question)), _infer_metric_from_text(question), tokens
+
+
+class SemanticCache:
+    def __init__(self, bits: int = 16, tables: int = 8, threshold: float = 0.95,
+                 max_entries: int = 256, seed: int = 0):
+        if not 0 < bits <= 64:
+            raise ValueError("bits 必须在 1..64 之间（桶号是 uint64）")
+        self.bits = bits
+        self.tables = tables
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._rng = np.random.default_rng(seed)
+        # 以下两者首次编码时按向量维度生成
+        self._planes: Optional[np.ndarray] = None  # (tables * bits, dim)
+        self._emb: Optional[np.ndarray] = None     # (max_entries, dim)，按槽位存缓存向量
+        self._bit_weights = np.left_shift(np.uint64(1), np.arange(bits - 1, -1, -1, dtype=np.uint64))
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(tables)]
+        # id -> (槽位, 签名, 问题类型, 结果)，按插入顺序淘汰
+        self._entries: "OrderedDict[int, Tuple[int, Tuple, Optional[str], Dict[str, Any]]]" = OrderedDict()
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._next_id = 0
+        self._day = date.today()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._buckets = [{} for _ in range(self.tables)]
+        self._entries.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._day = date.today()
+
+    # ===== 编码与哈希 =====
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        try:
+            v = rag_agent.encode([question])[0]
+        except Exception:
+            return None  # 模型不可用时缓存直接旁路
+        v = np.ascontiguousarray(v, dtype=np.float32)
+        if self._planes is None:
+            self._planes = self._rng.standard_normal((self.tables * self.bits, v.shape[0])).astype(np.float32)
+            self._emb = np.zeros((self.max_entries, v.shape[0]), dtype=np.float32)
+        return v
+
+    def _keys(self, v: np.ndarray) -> List[int]:
+        if _hash_vector_jit is not None:
+            return _hash_vector_jit(v, self._planes, self.tables, self.bits).tolist()
+        signs = (self._planes @ v > 0).reshape(self.tables, self.bits).astype(np.uint64)
+        return (signs @ self._bit_weights).tolist()
+
+    def _best_slot(self, v: np.ndarray, slots: np.ndarray) -> int:
+        """slots 中余弦最大且 ≥ 阈值的位置，没有返回 -1"""
+        if _verify_jit is not None:
+            return int(_verify_jit(v, self._emb, slots, float(self.threshold)))
+        cand = self._emb[slots]
+        denom = np.linalg.norm(cand, axis=1) * np.linalg.norm(v)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = np.where(denom > 0, cand @ v / denom, -np.inf)
+        i = int(np.argmax(sims))
+        return i if sims[i] >= self.threshold else -1
+
+    def _check_day(self) -> None:
+        if self._day != date.today():
+            self.clear()
+
+    # ===== 读写 =====
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """命中返回缓存的整图结果（深拷贝，调用方随便改），未命中返回 None"""
+        self._check_day()
+        if not self._entries:
+            return None
+        v = self._embed(question)
+        if v is None:
+            return None
+        sig = _signature(question)
+        candidates = set()
+        for table, key in zip(self._buckets, self._keys(v)):
+            candidates.update(table.get(key, ()))
+        eids = [eid for eid in candidates if self._entries[eid][1] == sig]
+        if not eids:
+            return None
+        slots = np.fromiter((self._entries[eid][0] for eid in eids), dtype=np.int64, count=len(eids))
+        i = self._best_slot(v, slots)
+        return copy.deepcopy(self._entries[eids[i]][3]) if i >= 0 else None
+
+    def put(self, question: str, result: Dict[str, Any]) -> None:
+        """只缓存真正给出了答案的结果；与之近似、但问题类型不同的旧条目一并作废"""
+        self._check_day()
+        if not result or not result.get("answer"):
+            return
+        v = self._embed(question)
+        if v is None:
+            return
+        sig = _signature(question)
+        qtype = (result.get("hints") or {}).get("question_type")
+        stale = [eid for eid, (slot, esig, etype, _) in self._entries.items()
+                 if esig == sig and etype != qtype and float(self._emb[slot] @ v) >= self.threshold]
+        for eid in stale:
+            self._drop(eid)
+        while len(self._entries) >= self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+        eid = self._next_id
+        self._next_id += 1
+        slot = self._free_slots.pop()
+        self._emb[slot] = v
+        # 存一份深拷贝：调用方之后再改 result 不影响缓存
+        self._entries[eid] = (slot, sig, qtype, copy.deepcopy(result))
+        for table, key in zip(self._buckets, self._keys(v)):
+            table.setdefault(key, []).append(eid)
+
+    def _drop(self, eid: int) -> None:
+        slot = self._entries.pop(eid)[0]
+        for table, key in zip(self._buckets, self._keys(self._emb[slot])):
+            ids = table.get(key)
+            if ids and eid in ids:
+                ids.remove(eid)
+                if not ids:
+                    del table[key]
+        self._free_slots.append(slot)
@@ -1,10 +1,12 @@
 from __future__ import annotations
-import json, time
-from typing import Dict, Any, List, Tuple
+import json, time, asyncio, hashlib
+from typing import Dict, Any, List, Tuple, Iterator
+from functools import lru_cache
 import streamlit as st
 import pandas as pd
 from tools.graph import agent
 from tools.graph import USE_RAG
+from tools.semantic_cache import SemanticCache
 
 st.set_page_config(page_title="Building Q&A (LangGraph)", page_icon="🤖", layout="wide")
 st.title("🤖 Building Q&A · RAG & LangGraph")
@@ -12,6 +14,21 @@ st.title("🤖 Building Q&A · RAG & LangGraph")
 # ========== 会话内历史 ==========
 if "history" not in st.session_state:
     st.session_state["history"] = []
+# 语义缓存：同义问题直接复用上次结果，跨 rerun 保留
+if "semantic_cache" not in st.session_state:
+    st.session_state["semantic_cache"] = SemanticCache()
+
+
+def _rows_key(rows: List[Dict[str, Any]]) -> str:
+    return hashlib.blake2b(
+        json.dumps(rows, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"), digest_size=8
+    ).hexdigest()
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _rows_to_df(rows_key: str, _rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    # 只按 rows_key 缓存（参数名带下划线的不参与 Streamlit 的哈希）；rerun 时不再重建 DataFrame
+    return pd.DataFrame(_rows)
 
 
 def show_df(name: str, rows: List[Dict[str, Any]]):
@@ -19,7 +36,7 @@ def show_df(name: str, rows: List[Dict[str, Any]]):
         st.info(f"{name}：无数据")
         return None
     try:
-        df = pd.DataFrame(rows)
+        df = _rows_to_df(_rows_key(rows), rows)
         st.dataframe(df, width='stretch')
         return df
     except Exception:
@@ -27,6 +44,39 @@ def show_df(name: str, rows: List[Dict[str, Any]]):
         return None
 
 
+def stream_answer(question: str, holder: Dict[str, Any]) -> Iterator[str]:
+    """
+    跑整张图，边跑边吐出 answer 节点里 LLM 生成的 token（LangGraph 的 messages 流模式，
+    节点里照常 llm.invoke 即可）；跑完后最终状态放进 holder["result"]，与 agent.invoke 的返回一致。
+    """
+    for mode, payload in agent.stream({"question": question}, stream_mode=["messages", "values"]):
+        if mode == "values":
+            holder["result"] = payload
+        else:
+            chunk, meta = payload
+            if meta.get("langgraph_node") == "answer":
+                text = getattr(chunk, "content", None)
+                if isinstance(text, str) and text:
+                    yield text
+
+
+def run_batch(questions: List[str], semantic_cache: SemanticCache) -> List[Tuple[Dict[str, Any], bool]]:
+    """
+    多个问题一起跑：语义缓存先挡一遍，未命中的用 agent.abatch 并发执行
+    （LLM 往返按问题重叠，不再一个接一个等）。返回与 questions 对齐的 (结果, 是否命中缓存)。
+    """
+    results: List[Dict[str, Any] | None] = [semantic_cache.get(q) for q in questions]
+    hits = [r is not None for r in results]
+    todo = [i for i, r in enumerate(results) if r is None]
+    if todo:
+        states = [{"question": questions[i]} for i in todo]
+        outs = asyncio.run(agent.abatch(states, config={"max_concurrency": 8}))
+        for i, out in zip(todo, outs):
+            results[i] = out
+            semantic_cache.put(questions[i], out)
+    return list(zip(results, hits))
+
+
 def build_frames_from_trace(trace: List[str], hints: Dict[str, Any] | None = None,
                             retries: int = 0, fallback_strategy: str = "none") -> List[Dict[str, Any]]:
     alias = {
@@ -43,16 +93,16 @@ def build_frames_from_trace(trace: List[str], hints: Dict[str, Any] | None = Non
 
     seq = [alias.get(str(x), str(x)) for x in trace if x]
     hints = hints or {}
+    qtype = hints.get("question_type")
+    time_kind = (hints.get("time_range") or {}).get("kind")
 
     # 拓扑类问题处理
-    if hints.get("question_type") == "topology" and "execute_sparql" in seq and "analyze" not in seq:
+    if qtype == "topology" and "execute_sparql" in seq and "analyze" not in seq:
         if "topology_answer" not in seq:
             seq.insert(seq.index("execute_sparql") + 1, "topology_answer")
 
     # 精确时间点问题处理
-    time_range = hints.get("time_range")
-    if time_range and time_range.get(
-            "kind") == "point_in_time" and "execute_sparql" in seq and "analyze_point_in_time" not in seq:
+    if time_kind == "point_in_time" and "execute_sparql" in seq and "analyze_point_in_time" not in seq:
         seq.insert(seq.index("execute_sparql") + 1, "analyze_point_in_time")
 
     # 回退策略处理
@@ -71,120 +121,182 @@ def build_frames_from_trace(trace: List[str], hints: Dict[str, Any] | None = Non
                 seq.insert(last_execute_idx + 2, "rag")
                 seq.insert(last_execute_idx + 3, "generate_sparql")
 
-    frames, active_nodes, active_edges = [], [], []
+    # 每帧只记本步新激活的节点/边（没有新增为 None），累计状态由 frame_dots 逐帧重建，
+    # 总存储 O(N) 而不是每帧一份全量快照的 O(N²)
+    frames: List[Dict[str, Any]] = []
+    seen_nodes: set = set()
+    seen_edges: set = set()
     for i, node in enumerate(seq):
-        if node not in active_nodes:
-            active_nodes.append(node)
+        add_node = add_edge = None
+        if node not in seen_nodes:
+            seen_nodes.add(node)
+            add_node = node
         if i > 0:
             edge = (seq[i - 1], seq[i])
-            if edge not in active_edges:
-                active_edges.append(edge)
-        frames.append({"nodes": list(active_nodes), "edges": list(active_edges)})
-
-    if not frames and seq:
-        frames.append({"nodes": [seq[0]], "edges": []})
+            if edge not in seen_edges:
+                seen_edges.add(edge)
+                add_edge = edge
+        frames.append({"add_node": add_node, "add_edge": add_edge})
     return frames
 
 
-def build_dot(
-        active_nodes: List[str],
-        active_edges: List[Tuple[str, str]],
-        retries: int = 0,
-        fallback_strategy: str = "none"
-) -> str:
-    core_nodes = [
-        "intent", "rag", "normalize_time", "generate_sparql", "execute_sparql",
-        "route_zero_rows", "analyze", "analyze_point_in_time", "topology_answer", "answer",
-        "fallback_level_1", "fallback_level_2",
-    ]
+# ===== 流程图 DOT =====
+# 节点、边、文字都是固定的：每个节点/边的“激活/未激活”两种语句导入时各生成一次，
+# 每帧只按激活集合挑选拼接；同一组激活状态的结果再按参数缓存
+_CORE_NODES = [
+    "intent", "rag", "normalize_time", "generate_sparql", "execute_sparql",
+    "route_zero_rows", "analyze", "analyze_point_in_time", "topology_answer", "answer",
+    "fallback_level_1", "fallback_level_2",
+]
+
+_ALL_EDGES: List[Tuple[str, str]] = (
+    [("intent", "rag"), ("rag", "normalize_time")] if USE_RAG else [("intent", "normalize_time")]
+) + [
+    ("normalize_time", "generate_sparql"),
+    ("generate_sparql", "execute_sparql"),
+    ("execute_sparql", "analyze"),
+    ("execute_sparql", "analyze_point_in_time"),
+    ("execute_sparql", "topology_answer"),
+    ("topology_answer", "answer"),
+    ("execute_sparql", "answer"),
+    ("execute_sparql", "route_zero_rows"),
+    ("route_zero_rows", "fallback_level_1"),
+    ("fallback_level_1", "generate_sparql"),
+    ("route_zero_rows", "fallback_level_2"),
+    ("fallback_level_2", "rag"),
+    ("analyze", "answer"),
+    ("analyze_point_in_time", "answer"),
+]
+
+_LABEL_MAP = {
+    "intent": "意图解析", "rag": "RAG检索", "normalize_time": "时间归一化",
+    "generate_sparql": "生成SPARQL", "execute_sparql": "执行SPARQL",
+    "route_zero_rows": "0行回退", "analyze": "统计调度器",
+    "analyze_point_in_time": "精确时间点分析", "topology_answer": "结构性回答",
+    "answer": "最终回答", "fallback_level_1": "第一级回退\nLLM生成",
+    "fallback_level_2": "第二级回退\nRAG增强",
+}
+
+_DOT_HEADER = "\n".join(['digraph G {', 'rankdir=LR;', 'splines=true;', 'nodesep=0.5;', 'ranksep=0.8;'])
+
+
+def _node_stmt(n: str, active: bool) -> str:
+    label = _LABEL_MAP.get(n, n).replace('"', "'")
+    if n.startswith("fallback_"):
+        if active:
+            return f'"{n}" [shape=box, style=filled, fillcolor="#FBD38D", label="{label}"];'
+        else:
+            return f'"{n}" [shape=box, color="#F6AD55", fontcolor="#744210", label="{label}"];'
+    elif active:
+        return f'"{n}" [shape=box, style=filled, fillcolor="#C6F6D5", label="{label}"];'
+    else:
+        return f'"{n}" [shape=box, color="#CBD5E0", fontcolor="#4A5568", label="{label}"];'
 
-    all_edges: List[Tuple[str, str, str]] = []
 
-    if USE_RAG:
-        all_edges += [("intent", "rag", "forward"), ("rag", "normalize_time", "forward")]
-    else:
-        all_edges += [("intent", "normalize_time", "forward")]
-
-    all_edges += [
-        ("normalize_time", "generate_sparql", "forward"),
-        ("generate_sparql", "execute_sparql", "forward"),
-        ("execute_sparql", "analyze", "forward"),
-        ("execute_sparql", "analyze_point_in_time", "forward"),
-        ("execute_sparql", "topology_answer", "forward"),
-        ("topology_answer", "answer", "forward"),
-        ("execute_sparql", "answer", "forward"),
-        ("execute_sparql", "route_zero_rows", "forward"),
-        ("route_zero_rows", "fallback_level_1", "forward"),
-        ("fallback_level_1", "generate_sparql", "forward"),
-        ("route_zero_rows", "fallback_level_2", "forward"),
-        ("fallback_level_2", "rag", "forward"),
-        ("analyze", "answer", "forward"),
-        ("analyze_point_in_time", "answer", "forward"),
-    ]
-
-    active_nodes_set = set(active_nodes or [])
-    active_edges_set = set(active_edges or [])
+def _edge_stmt(a: str, b: str, active: bool) -> str:
+    color = "#2F855A" if active else "#CBD5E0"
+    penwidth = "2.4" if active else "1.0"
 
-    if retries > 0:
-        if fallback_strategy == "level_1":
-            active_nodes_set.add("fallback_level_1")
-            active_edges_set.add(("route_zero_rows", "fallback_level_1"))
-            active_edges_set.add(("fallback_level_1", "generate_sparql"))
-        elif fallback_strategy in ["level_2", "level_1_fallback"]:
-            active_nodes_set.add("fallback_level_2")
-            active_edges_set.add(("route_zero_rows", "fallback_level_2"))
-            active_edges_set.add(("fallback_level_2", "rag"))
-            active_edges_set.add(("rag", "generate_sparql"))
-
-    label_map = {
-        "intent": "意图解析", "rag": "RAG检索", "normalize_time": "时间归一化",
-        "generate_sparql": "生成SPARQL", "execute_sparql": "执行SPARQL",
-        "route_zero_rows": "0行回退", "analyze": "统计调度器",
-        "analyze_point_in_time": "精确时间点分析", "topology_answer": "结构性回答",
-        "answer": "最终回答", "fallback_level_1": "第一级回退\nLLM生成",
-        "fallback_level_2": "第二级回退\nRAG增强",
-    }
+    if a.startswith("fallback_") or b.startswith("fallback_"):
+        color = "#DD6B20" if active else "#F6AD55"
+        penwidth = "2.8" if active else "1.2"
 
-    def node_stmt(n: str) -> str:
-        label = label_map.get(n, n).replace('"', "'")
-        if n.startswith("fallback_"):
-            if n in active_nodes_set:
-                return f'"{n}" [shape=box, style=filled, fillcolor="#FBD38D", label="{label}"];'
-            else:
-                return f'"{n}" [shape=box, color="#F6AD55", fontcolor="#744210", label="{label}"];'
-        elif n in active_nodes_set:
-            return f'"{n}" [shape=box, style=filled, fillcolor="#C6F6D5", label="{label}"];'
-        else:
-            return f'"{n}" [shape=box, color="#CBD5E0", fontcolor="#4A5568", label="{label}"];'
+    return f'"{a}" -> "{b}" [color="{color}", penwidth={penwidth}];'
 
-    def edge_stmt(a: str, b: str) -> str:
-        active = (a, b) in active_edges_set
-        color = "#2F855A" if active else "#CBD5E0"
-        penwidth = "2.4" if active else "1.0"
 
-        if a.startswith("fallback_") or b.startswith("fallback_"):
-            color = "#DD6B20" if active else "#F6AD55"
-            penwidth = "2.8" if active else "1.2"
+# (未激活, 激活) 两种写法，按 bool 下标取
+_NODE_STMTS = {n: (_node_stmt(n, False), _node_stmt(n, True)) for n in _CORE_NODES}
+_EDGE_STMTS = [((a, b), (_edge_stmt(a, b, False), _edge_stmt(a, b, True))) for a, b in _ALL_EDGES]
 
-        return f'"{a}" -> "{b}" [color="{color}", penwidth={penwidth}];'
+# 发生重试时按回退策略额外点亮的 (节点, 边)
+_LEVEL_2_HIGHLIGHT = (
+    frozenset({"fallback_level_2"}),
+    frozenset({("route_zero_rows", "fallback_level_2"), ("fallback_level_2", "rag"), ("rag", "generate_sparql")}),
+)
+_FALLBACK_HIGHLIGHT = {
+    "level_1": (
+        frozenset({"fallback_level_1"}),
+        frozenset({("route_zero_rows", "fallback_level_1"), ("fallback_level_1", "generate_sparql")}),
+    ),
+    "level_2": _LEVEL_2_HIGHLIGHT,
+    "level_1_fallback": _LEVEL_2_HIGHLIGHT,
+}
 
-    lines = [
-        'digraph G {', 'rankdir=LR;', 'splines=true;', 'nodesep=0.5;', 'ranksep=0.8;'
-    ]
 
-    for n in core_nodes:
-        lines.append(node_stmt(n))
+def build_dot(
+        active_nodes: List[str],
+        active_edges: List[Tuple[str, str]],
+        retries: int = 0,
+        fallback_strategy: str = "none"
+) -> str:
+    return _build_dot_cached(
+        frozenset(active_nodes or ()), frozenset(active_edges or ()), retries > 0, fallback_strategy
+    )
 
-    for (a, b, _) in all_edges:
-        lines.append(edge_stmt(a, b))
 
+@lru_cache(maxsize=256)
+def _build_dot_cached(
+        active_nodes: frozenset,
+        active_edges: frozenset,
+        has_retries: bool,
+        fallback_strategy: str,
+) -> str:
+    highlight = _FALLBACK_HIGHLIGHT.get(fallback_strategy) if has_retries else None
+    if highlight is not None:
+        active_nodes = active_nodes | highlight[0]
+        active_edges = active_edges | highlight[1]
+
+    lines = [_DOT_HEADER]
+    lines.extend(_NODE_STMTS[n][n in active_nodes] for n in _CORE_NODES)
+    lines.extend(stmts[edge in active_edges] for edge, stmts in _EDGE_STMTS)
     lines.append("}")
     return "\n".join(lines)
 
 
+def frame_dots(frames: List[Dict[str, Any]], retries: int = 0, fallback_strategy: str = "none") -> List[str]:
+    """
+    逐帧 DOT：按增量帧累加出当前激活的节点/边再渲染；
+    重试时回访已激活的节点/边，这一帧没有新增，直接跳过（渲染结果与上一帧相同）
+    """
+    dots: List[str] = []
+    cum_nodes: List[str] = []
+    cum_edges: List[Tuple[str, str]] = []
+    for fr in frames:
+        if fr["add_node"] is None and fr["add_edge"] is None and dots:
+            continue
+        if fr["add_node"] is not None:
+            cum_nodes.append(fr["add_node"])
+        if fr["add_edge"] is not None:
+            cum_edges.append(fr["add_edge"])
+        dot = build_dot(cum_nodes, cum_edges, retries, fallback_strategy)
+        if not dots or dot != dots[-1]:
+            dots.append(dot)
+    return dots
+
+
+# 流程动画：有 st.fragment（旧版叫 experimental_fragment）时，每 0.6s 只重跑这一小段、
+# 推进一帧，脚本线程不再 sleep 阻塞；没有时退回逐帧 sleep。
+# run_every 的计时器只有整页重跑才会取消：最后一帧停留一拍后整页重跑一次，
+# 这次不再调用定时 fragment，按 graph_final_view 里存的结果静态画出最终流程图
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+if _fragment is not None:
+    @_fragment(run_every=0.6)
+    def _graph_animation() -> None:
+        dots = st.session_state.get("graph_dots") or []
+        i = st.session_state.get("graph_frame", 0)
+        if i >= len(dots):
+            st.session_state["graph_dots"] = []
+            st.rerun()
+        st.graphviz_chart(dots[i], width='stretch')
+        st.session_state["graph_frame"] = i + 1
+else:
+    _graph_animation = None
+
+
 # 侧边栏历史
 st.sidebar.header("🕘 最近提问历史")
-_hist = list(reversed(st.session_state["history"]))[:5]
+_hist = st.session_state["history"][-5:][::-1]  # 只拷贝最近 5 条再反转
 if not _hist:
     st.sidebar.write("（暂无历史）")
 else:
@@ -202,9 +314,23 @@ with st.form("qa_form"):
     q = st.text_input("问题：", placeholder="例如：前天305房间的平均温度是多少？或 整栋楼有多少个房间？")
     submitted = st.form_submit_button("询问")
 
+view: Dict[str, Any] | None = None
 if submitted and q.strip():
-    with st.spinner("正在查询..."):
-        result: Dict[str, Any] = agent.invoke({"question": q})
+    semantic_cache: SemanticCache = st.session_state["semantic_cache"]
+    result: Dict[str, Any] | None = semantic_cache.get(q)
+    cache_hit = result is not None
+
+    st.subheader("答案")
+    answer_slot = st.empty()
+    if not cache_hit:
+        holder: Dict[str, Any] = {}
+        with st.spinner("正在查询..."):
+            with answer_slot.container():
+                st.write_stream(stream_answer(q, holder))
+        result = holder.get("result") or {}
+        semantic_cache.put(q, result)
+    # 流式显示的是原始 token；跑完换成 answer_agent 清洗过的最终答案
+    answer_slot.write(result.get("answer") or "（无）")
 
     # 保存历史
     fallback_strategy = result.get("fallback_strategy", "none")
@@ -215,9 +341,18 @@ if submitted and q.strip():
         "rows_count": len(result.get("rows") or []),
         "retries": retries, "fallback_strategy": fallback_strategy,
     })
-
-    st.subheader("答案")
-    st.write(result.get("answer") or "（无）")
+    view = {"result": result, "cache_hit": cache_hit, "animate": True}
+else:
+    # 流程动画播完触发的那次整页重跑：按保存的结果再画一遍，流程图直接给最终帧
+    view = st.session_state.pop("graph_final_view", None)
+    if view is not None:
+        st.subheader("答案")
+        st.write(view["result"].get("answer") or "（无）")
+
+if view is not None:
+    result, cache_hit = view["result"], view["cache_hit"]
+    fallback_strategy = result.get("fallback_strategy", "none")
+    retries = result.get("retries", 0)
 
     col1, col2 = st.columns([3, 2], gap="large")
     with col1:
@@ -229,11 +364,19 @@ if submitted and q.strip():
             st.error("后端未返回 trace。")
         else:
             frames = build_frames_from_trace(trace, hints, retries, fallback_strategy)
-            graph_placeholder = st.empty()
-            for fr in frames:
-                dot = build_dot(fr["nodes"], fr["edges"], retries, fallback_strategy)
-                graph_placeholder.graphviz_chart(dot, width='stretch')
-                time.sleep(0.6)
+            dots = frame_dots(frames, retries, fallback_strategy)
+            if not view["animate"] or len(dots) == 1:
+                st.graphviz_chart(dots[-1], width='stretch')
+            elif _graph_animation is not None:
+                st.session_state["graph_dots"] = dots
+                st.session_state["graph_frame"] = 0
+                st.session_state["graph_final_view"] = {**view, "animate": False}
+                _graph_animation()
+            else:
+                graph_placeholder = st.empty()
+                for dot in dots:
+                    graph_placeholder.graphviz_chart(dot, width='stretch')
+                    time.sleep(0.6)
 
     with col2:
         st.subheader("运行状态")
@@ -241,6 +384,7 @@ if submitted and q.strip():
         st.markdown(f"- RAG 分支：{'开启' if USE_RAG else '关闭'}")
         st.markdown(f"- 结果行数：{len(result.get('rows') or [])}")
         st.markdown(f"- 需要统计：{bool(result.get('need_stats'))}")
+        st.markdown(f"- 语义缓存：{'命中' if cache_hit else '未命中'}")
 
         if retries > 0:
             st.markdown(f"- 回退策略：{fallback_strategy}")
@@ -272,4 +416,32 @@ if submitted and q.strip():
         show_df("analysis", result.get("analysis") or [])
 
 else:
-    st.info("输入你的问题后点击【询问】。")
\ No newline at end of file
+    st.info("输入你的问题后点击【询问】。")
+
+# 批量提问：每行一个问题，并发执行
+with st.expander("📋 批量提问", expanded=False):
+    with st.form("batch_form"):
+        batch_text = st.text_area("每行一个问题：", height=150)
+        batch_submitted = st.form_submit_button("批量询问")
+
+    batch_questions = [line.strip() for line in (batch_text or "").splitlines() if line.strip()]
+    if batch_submitted and batch_questions:
+        with st.spinner(f"正在并发查询 {len(batch_questions)} 个问题..."):
+            batch_results = run_batch(batch_questions, st.session_state["semantic_cache"])
+
+        summary = []
+        for bq, (res, hit) in zip(batch_questions, batch_results):
+            answer = res.get("answer") or "（无）"
+            rows_count = len(res.get("rows") or [])
+            retries = res.get("retries", 0)
+            fallback_strategy = res.get("fallback_strategy", "none")
+            st.session_state["history"].append({
+                "q": bq, "answer": answer, "rows_count": rows_count,
+                "retries": retries, "fallback_strategy": fallback_strategy,
+            })
+            summary.append({
+                "问题": bq, "答案": answer, "问题类型": (res.get("hints") or {}).get("question_type"),
+                "结果行数": rows_count, "重试次数": retries, "回退策略": fallback_strategy,
+                "语义缓存": "命中" if hit else "未命中",
+            })
+        st.dataframe(pd.DataFrame(summary), width='stretch')
\ No newline at end of file
@@ -0,0 +1,76 @@
+# data_generator/_signals_numba.py
+"""
+data_generator 的可选加速内核（需要 numba）。
+
+simulate 把 daily_shapes_batch 的基础值、高斯抖动、截断合成一遍遍历，原地把 (5, R, D*P)
+的标准正态样本缓冲改写成五路信号（温度/湿度/照度/CO2/PM2.5）；日内波形只按一天的 P 个点算一次，
+各天共用，再按房间 prange 分到多核。
+抖动样本由调用方用 NumPy Generator 填好缓冲后传入，所以结果与线程数无关、与 NumPy 路径一致
+（不开 fastmath，保证同一个 seed 装不装 numba 写出的数相同）。
+没装 numba 时 simulate 为 None，调用方自动走纯 NumPy 路径。
+"""
+from __future__ import annotations
+import math
+import numpy as np
+
+try:
+    from numba import njit, prange
+except Exception:
+    njit = None
+    prange = range
+
+
+def _simulate(room_idx, t_norm, buf):
+    """
+    room_idx: 房间索引 int64 (R,)
+    t_norm:   一天内各点的归一化位置 float64 (P,)
+    buf:      标准正态样本 float64 (5, R, D*P)，原地改写为信号值（第 j 个采样点对应日内第 j % P 个点）
+    """
+    n_rooms = room_idx.shape[0]
+    n_p = t_norm.shape[0]
+    n_t = buf.shape[2]
+
+    # 与房间、日期无关的日内部分，只算一次
+    wave = np.empty(n_p)
+    lux_day = np.empty(n_p)
+    work_wave = np.empty(n_p)
+    is_day = np.zeros(n_p, dtype=np.bool_)
+    is_work = np.zeros(n_p, dtype=np.bool_)
+    for j in range(n_p):
+        hour = t_norm[j] * 24.0
+        wave[j] = math.sin(2 * math.pi * (t_norm[j] - 0.25))
+        is_day[j] = 7 <= hour <= 18
+        is_work[j] = 9 <= hour <= 18
+        lux_day[j] = 300.0 + 600.0 * math.cos((hour - 12) * math.pi / 11)
+        work_wave[j] = math.sin((hour - 9) * math.pi / 9)
+
+    for r in prange(n_rooms):
+        k = room_idx[r]
+        temp_off = 0.1 * (k % 5)
+        rh_off = 2.0 * ((k % 3) - 1)
+        lux_night = 20.0 + 10.0 * (k % 4)
+        co2_off = 5.0 * (k % 7)
+        co2_night = 500.0 + 10.0 * (k % 7)
+        pm25_off = 0.5 * (k % 11)
+        for j in range(n_t):
+            p = j % n_p
+            lux = lux_day[p] if is_day[p] else lux_night
+            if is_work[p]:
+                co2 = 600.0 + 400.0 * work_wave[p] + co2_off
+                pm25 = 15.0 + 10.0 * work_wave[p] + pm25_off
+            else:
+                co2 = co2_night
+                pm25 = 8.0 + pm25_off
+            buf[0, r, j] = 23.0 + 2.0 * wave[p] + temp_off + 0.25 * buf[0, r, j]
+            buf[1, r, j] = min(max(50.0 - 5.0 * wave[p] + rh_off + 1.5 * buf[1, r, j], 0.0), 100.0)
+            buf[2, r, j] = max(max(lux, 0.0) + 25.0 * buf[2, r, j], 0.0)
+            buf[3, r, j] = max(max(co2, 350.0) + 30.0 * buf[3, r, j], 350.0)
+            buf[4, r, j] = max(max(pm25, 2.0) + 2.5 * buf[4, r, j], 2.0)
+
+
+if njit is not None:
+    simulate = njit(
+        "void(int64[:], float64[:], float64[:, :, :])", cache=True, parallel=True, nogil=True
+    )(_simulate)
+else:
+    simulate = None
@@ -1,12 +1,16 @@
 from __future__ import annotations
 import os
-import math
-import csv
 import random
+import re
+import shutil
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Tuple, List, Optional
 
+import numpy as np
+
 try:
     from dateutil import tz  # timezone handling
 except Exception:
@@ -20,6 +24,11 @@ DEFAULT_NUM_ROOMS = 500
 DEFAULT_DAYS_BACK = 7
 DEFAULT_OUT_DIR = r"F:\Task\RAG-LangGraph-Demo\data"
 DEFAULT_SEED: Optional[int] = None
+WRITE_BUFFER_SIZE = 1 << 20  # 输出文件都是 MB 级，用 1 MiB 写缓冲代替默认 8 KiB，减少系统调用
+# 房间数 × 采样点数达到这个量级才启用 numba 内核：单是 import numba 就要约 0.3s，
+# 默认规模（500 房间 × 192 点）NumPy 几毫秒就算完，用不上
+NUMBA_MIN_SAMPLES = 20_000_000
+CSV_LINE_END = "\r\n"  # 与之前 csv.DictWriter 的默认行尾保持一致
 
 # Brick-friendly subclasses for rooms (randomly assign for realism)
 ROOM_SUBCLASSES = [
@@ -33,6 +42,18 @@ ROOM_SUBCLASSES = [
 # Rooms of these types will get IAQ (CO2/PM2.5) sensors
 IAQ_ELIGIBLE_TYPES = {"Office", "Conference_Room", "Office_Kitchen"}
 
+# CSV 里的五路传感器：(ts_id 后缀, unit 列, 数值格式)，顺序与 _simulate_signals 的输出一致，IAQ 两路在最后。
+# 文本要与 round(v, n) 后 str() 的结果一致：.1f 本身就是；.2f 写完再去掉末尾的 0（23.10 -> 23.1）
+CSV_SENSORS = (
+    ("temp", "DEG_C", ".2f"),
+    ("rh", "PERCENT_RH", ".2f"),
+    ("lux", "LUX", ".1f"),
+    ("co2", "PPM", ".1f"),
+    ("pm25", "MicroGM-PER-M3", ".1f"),
+)
+# 两位小数的值后面紧跟 unit 列、换行或块尾；时间戳里没有“点 + 一位数字 + 0 + 逗号”这种模式
+_TRAILING_ZERO_RE = re.compile(r"(\.\d)0(?=,|\r|$)")
+
 
 # --------------------------- Time helpers ---------------------------
 def ensure_tz(tz_name: str):
@@ -68,44 +89,122 @@ def gen_time_points_multiday(start_local: datetime, end_local: datetime, points_
     return [start_local + timedelta(seconds=i * step_seconds) for i in range(total_points)]
 
 
+def iso_timestamps(times_local: List[datetime], points_per_day: int) -> List[str]:
+    """
+    times_local 的 isoformat 字符串，结果与逐个 t.isoformat() 相同。
+    起点是零点、步长为整秒时，同一天内各点只有时分秒不同：日期前缀和时区后缀每天取一次，
+    时分秒按槽位预先格式化一遍，按天拼接，不再每个点跑一次 isoformat。
+    当天首尾 UTC 偏移不同（夏令时切换日）或不满足上述条件时，退回逐点 isoformat。
+    """
+    n = len(times_local)
+    if n == 0 or 86400 % points_per_day or times_local[0].time() != datetime.min.time():
+        return [t.isoformat() for t in times_local]
+
+    step = 86400 // points_per_day
+    slot_suffixes = [f"T{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(0, 86400, step)]
+    out: List[str] = []
+    for lo in range(0, n, points_per_day):
+        hi = min(lo + points_per_day, n)
+        first = times_local[lo]
+        if first.utcoffset() != times_local[hi - 1].utcoffset():
+            out += [t.isoformat() for t in times_local[lo:hi]]
+            continue
+        first_iso = first.isoformat()
+        date_prefix, tz_suffix = first_iso[:10], first_iso[19:]
+        out += [date_prefix + slot + tz_suffix for slot in slot_suffixes[:hi - lo]]
+    return out
+
+
 # --------------------------- Synthetic signals ---------------------------
-def daily_shapes(room_idx: int, t_norm: float):
+def daily_shapes_batch(room_idx_arr: np.ndarray, t_norm_arr: np.ndarray):
     """
-    给定房间索引和一天中的归一化位置(0~1)，返回基础值(温度/湿度/照度/CO2/PM2.5)的平滑日变化趋势。
+    给定房间索引数组 (R,) 和一天中的归一化位置数组 (P,)(0~1)，一次返回五路基础值
+    (温度/湿度/照度/CO2/PM2.5) 的平滑日变化趋势，每路都是 (R, P) 数组。
+    房间偏移沿行广播、日内波形沿列广播，整块走 NumPy，不再逐点调用标量 math。
     """
+    room = np.asarray(room_idx_arr, dtype=np.int64)[:, None]
+    t_norm = np.asarray(t_norm_arr, dtype=np.float64)[None, :]
+    hour = t_norm * 24.0
+    wave = np.sin(2 * np.pi * (t_norm - 0.25))
+
     # 温度：围绕23°C，带日波动+房间偏移
-    temp_base = 23.0 + 2.0 * math.sin(2 * math.pi * (t_norm - 0.25)) + 0.1 * (room_idx % 5)
+    temp_base = 23.0 + 2.0 * wave + 0.1 * (room % 5)
 
     # 湿度：围绕50%RH，反相波动
-    rh_base = 50.0 - 5.0 * math.sin(2 * math.pi * (t_norm - 0.25)) + 2.0 * ((room_idx % 3) - 1)
+    rh_base = 50.0 - 5.0 * wave + 2.0 * ((room % 3) - 1)
 
     # 照度：白天高，夜里低
-    hour = t_norm * 24.0
-    if 7 <= hour <= 18:
-        lux_base = 300.0 + 600.0 * math.cos((hour - 12) * math.pi / 11)
-    else:
-        lux_base = 20.0 + 10.0 * (room_idx % 4)
+    mask_day = (hour >= 7) & (hour <= 18)
+    lux_base = np.where(mask_day, 300.0 + 600.0 * np.cos((hour - 12) * np.pi / 11), 20.0 + 10.0 * (room % 4))
 
     # IAQ：上班时间 (9~18) CO2/PM2.5 上升
-    if 9 <= hour <= 18:
-        co2_base = 600.0 + 400.0 * math.sin((hour - 9) * math.pi / 9) + 5.0 * (room_idx % 7)
-        pm25_base = 15.0 + 10.0 * math.sin((hour - 9) * math.pi / 9) + 0.5 * (room_idx % 11)
-    else:
-        co2_base = 500.0 + 10.0 * (room_idx % 7)
-        pm25_base = 8.0 + 0.5 * (room_idx % 11)
+    mask_work = (hour >= 9) & (hour <= 18)
+    work_wave = np.sin((hour - 9) * np.pi / 9)
+    co2_base = np.where(mask_work, 600.0 + 400.0 * work_wave + 5.0 * (room % 7), 500.0 + 10.0 * (room % 7))
+    pm25_base = np.where(mask_work, 15.0 + 10.0 * work_wave + 0.5 * (room % 11), 8.0 + 0.5 * (room % 11))
 
     return (
         temp_base,
         rh_base,
-        max(lux_base, 0.0),
-        max(co2_base, 350.0),
-        max(pm25_base, 2.0),
+        np.maximum(lux_base, 0.0),
+        np.maximum(co2_base, 350.0),
+        np.maximum(pm25_base, 2.0),
     )
 
 
-def jitter(val: float, sigma: float) -> float:
-    """高斯抖动，让数据不像死公式"""
-    return float(val + random.gauss(0.0, sigma))
+def _np_rng(seed_val) -> np.random.Generator:
+    """
+    NumPy 随机源：seed 允许 int 或 str，先交给 random.Random 摊成 64 位整数，
+    同一个 seed 每次生成的抖动相同；seed 为 None 时不固定。
+    """
+    if seed_val is None:
+        return np.random.default_rng()
+    return np.random.default_rng(random.Random(seed_val).getrandbits(64))
+
+
+@lru_cache(maxsize=1)
+def _load_simulate_jit():
+    """按需导入 _signals_numba.simulate；没装 numba 或不在脚本目录下运行时返回 None"""
+    try:
+        from _signals_numba import simulate
+    except ImportError:
+        return None
+    return simulate
+
+
+def _simulate_signals(room_idx_arr: np.ndarray, t_norm_arr: np.ndarray, n_points: int,
+                      rng: np.random.Generator) -> np.ndarray:
+    """
+    基础值 + 高斯抖动 + 截断到合理范围，返回 (5, R, n_points)：温度/湿度/照度/CO2/PM2.5。
+    t_norm_arr 只是一天内的 P 个位置：基础值只和“一天中的第几个点”有关，每天都一样，
+    所以只算 (R, P) 一份，再按天平铺到 n_points 个采样点上，只有抖动逐点不同。
+    先往一块预分配的缓冲里一次性填满标准正态样本，再原地缩放、叠加基础值、截断，
+    全程只占这一块内存；规模够大且装了 numba 时由 _signals_numba 的并行内核原地完成，
+    两条路径结果一致。
+    """
+    room_idx_arr = np.asarray(room_idx_arr, dtype=np.int64)
+    t_norm_arr = np.asarray(t_norm_arr, dtype=np.float64)
+    n_rooms, n_per_day = room_idx_arr.size, t_norm_arr.size
+    n_days = -(-n_points // n_per_day)  # 最后一天不满时多算一截，返回前切掉
+    buf = np.empty((5, n_rooms, n_days * n_per_day))
+    rng.standard_normal(out=buf)
+
+    simulate_jit = _load_simulate_jit() if n_rooms * n_points >= NUMBA_MIN_SAMPLES else None
+    if simulate_jit is not None:
+        simulate_jit(room_idx_arr, t_norm_arr, buf)
+        return buf[:, :, :n_points]
+
+    bases = daily_shapes_batch(room_idx_arr, t_norm_arr)
+    # 各路抖动幅度与截断范围：温度不截断，湿度 0~100，其余只截下限
+    for k, (sigma, lo, hi) in enumerate(((0.25, None, None), (1.5, 0.0, 100.0), (25.0, 0.0, None),
+                                         (30.0, 350.0, None), (2.5, 2.0, None))):
+        # (R, D*P) 视作 (R, D, P)，(R, P) 的基础值沿天这一维广播，不用真的 np.tile 出来
+        signal = buf[k].reshape(n_rooms, n_days, n_per_day)
+        signal *= sigma
+        signal += bases[k][:, None, :]
+        if lo is not None:
+            np.clip(signal, lo, hi, out=signal)
+    return buf[:, :, :n_points]
 
 
 # --------------------------- TTL helpers ---------------------------
@@ -126,6 +225,83 @@ def ttl_header(building_urn: str = "urn:demo-building#", use_rec: bool = False)
 """
 
 
+# 单个房间的整块 TTL 模板。写成 f-string 函数而不是 str.format_map 模板：
+# f-string 编译期就拆好了，每块快约 4 倍（format_map 每次调用都要重新解析模板）
+def _ttl_room_block(rel_has_part: str, room_uri: str, room_types: str, area_val: float, room_name_lower: str) -> str:
+    """拓扑关系 + 类型 + 面积 + 常规传感器 (Temp / RH / Lux)"""
+    return f"""bldg:F1 {rel_has_part} {room_uri} .
+{room_uri} a {room_types} .
+{room_uri} brick:area [
+  brick:value {area_val} ;
+  brick:hasUnit unit:M2
+] .
+
+{room_uri}_Temp a brick:Air_Temperature_Sensor ;
+  brick:isPointOf {room_uri} ;
+  brick:hasUnit unit:DEG_C ;
+  ref:hasTimeseriesReference [
+    a ref:TimeseriesReference ;
+    ref:hasTimeseriesId "{room_name_lower}.temp" ;
+    ref:storedAt bldg:TSDB
+  ] .
+{room_uri}_RH a brick:Relative_Humidity_Sensor ;
+  brick:isPointOf {room_uri} ;
+  brick:hasUnit unit:PERCENT_RH ;
+  ref:hasTimeseriesReference [
+    a ref:TimeseriesReference ;
+    ref:hasTimeseriesId "{room_name_lower}.rh" ;
+    ref:storedAt bldg:TSDB
+  ] .
+{room_uri}_Lux a brick:Illuminance_Sensor ;
+  brick:isPointOf {room_uri} ;
+  brick:hasUnit unit:LUX ;
+  ref:hasTimeseriesReference [
+    a ref:TimeseriesReference ;
+    ref:hasTimeseriesId "{room_name_lower}.lux" ;
+    ref:storedAt bldg:TSDB
+  ] .
+"""
+
+def _ttl_room_iaq_block(room_uri: str, room_name_lower: str) -> str:
+    """IAQ 传感器 (CO2 / PM2.5)，只有 IAQ_ELIGIBLE_TYPES 的房间才有"""
+    return f"""{room_uri}_CO2 a brick:CO2_Level_Sensor ;
+  brick:isPointOf {room_uri} ;
+  brick:hasUnit unit:PPM ;
+  brick:measures bldg:CO2_Level ;
+  ref:hasTimeseriesReference [
+    a ref:TimeseriesReference ;
+    ref:hasTimeseriesId "{room_name_lower}.co2" ;
+    ref:storedAt bldg:TSDB
+  ] .
+{room_uri}_PM25 a brick:PM2.5_Sensor ;
+  brick:isPointOf {room_uri} ;
+  brick:hasUnit unit:MicroGM-PER-M3 ;
+  brick:measures bldg:PM25_Level ;
+  ref:hasTimeseriesReference [
+    a ref:TimeseriesReference ;
+    ref:hasTimeseriesId "{room_name_lower}.pm25" ;
+    ref:storedAt bldg:TSDB
+  ] .
+"""
+
+UNIT_DECLARATIONS = (
+    # 舒适环境指标
+    "unit:DEG_C a qudt:Unit .\n"
+    "unit:PERCENT_RH a qudt:Unit .\n"
+    "unit:LUX a qudt:Unit .\n"
+    # 面积
+    "unit:M2 a qudt:Unit .\n"
+    # IAQ
+    "unit:PPM a qudt:Unit .\n"
+    "unit:MicroGM-PER-M3 a qudt:Unit .\n"
+    # 量纲
+    "quantitykind:Temperature a qudt:QuantityKind .\n"
+    "quantitykind:RelativeHumidity a qudt:QuantityKind .\n"
+    "quantitykind:Illuminance a qudt:QuantityKind .\n"
+    "quantitykind:Air_Quality a qudt:QuantityKind .\n"
+)
+
+
 def _room_type_for_index(idx: int, rng: random.Random) -> str:
     """
     给房间选一个 Brick 子类（Office / Conference_Room / ...）
@@ -142,6 +318,22 @@ def _random_area_m2(idx: int, rng: random.Random) -> float:
     return round(base + rng.uniform(-5, 5), 2)
 
 
+@lru_cache(maxsize=8)
+def _build_room_meta(num_rooms: int, seed_val=None) -> Tuple[Tuple[str, ...], Tuple[float, ...]]:
+    """
+    一次性算出所有房间的 (subtype 列表, 面积列表)，下标 i-1 对应 Room_{i}。
+    每个房间仍用独立的 random.Random(f"{seed_val}_{i}_room") 先抽类型再抽面积，结果与逐房间现算一致；
+    TTL 和 CSV 共用这一份（同参数第二次调用直接命中缓存），保证两边 IAQ 判定一致。
+    """
+    subtypes: List[str] = []
+    areas: List[float] = []
+    for i in range(1, num_rooms + 1):
+        rng_room = random.Random(f"{seed_val}_{i}_room")
+        subtypes.append(_room_type_for_index(i, rng_room))
+        areas.append(_random_area_m2(i, rng_room))
+    return tuple(subtypes), tuple(areas)
+
+
 def write_topology_ttl(
     out_path: str,
     num_rooms: int,
@@ -161,144 +353,60 @@ def write_topology_ttl(
     """
 
     rng_meta = random.Random(str(seed_val) + "_meta")
-    lines: List[str] = [ttl_header(use_rec=use_rec)]
-
-    # (0) 定义可测量量，挂到 Air_Quality 上
-    lines += [
-        "bldg:CO2_Level a brick:Quantity ;\n"
-        "  rdfs:subClassOf brick:Air_Quality .\n\n",
-
-        "bldg:PM25_Level a brick:Quantity ;\n"
-        "  rdfs:subClassOf brick:Air_Quality .\n\n",
-    ]
 
     # (1) 空间层级：Site -> Building -> Floor -> Room_xxx
     if use_rec:
-        lines += [
-            "bldg:CampusA a rec:Campus .\n",
-            "bldg:BuildingA a rec:Building ;\n  rec:hasPart bldg:F1 .\n",
-            "bldg:F1 a rec:Level .\n\n",
-        ]
+        hierarchy = (
+            "bldg:CampusA a rec:Campus .\n"
+            "bldg:BuildingA a rec:Building ;\n  rec:hasPart bldg:F1 .\n"
+            "bldg:F1 a rec:Level .\n\n"
+        )
         rel_hasPart = "rec:hasPart"
-        room_superclass = "rec:Room"
     else:
-        lines += [
-            "bldg:CampusA a brick:Site ;\n  brick:hasPart bldg:BuildingA .\n",
-            "bldg:BuildingA a brick:Building ;\n  brick:hasPart bldg:F1 .\n",
-            "bldg:F1 a brick:Floor .\n\n",
-        ]
+        hierarchy = (
+            "bldg:CampusA a brick:Site ;\n  brick:hasPart bldg:BuildingA .\n"
+            "bldg:BuildingA a brick:Building ;\n  brick:hasPart bldg:F1 .\n"
+            "bldg:F1 a brick:Floor .\n\n"
+        )
         rel_hasPart = "brick:hasPart"
-        room_superclass = "brick:Room"
 
     # Floor 面积
     floor_area_val = _random_area_m2(999, rng_meta)
-    lines.append(f"""bldg:F1 brick:area [
-  brick:value {floor_area_val} ;
-  brick:hasUnit unit:M2
-] .\n\n""")
-
-    # (2) Room 循环
-    for i in range(1, num_rooms + 1):
-        room_name = f"Room_{i:03d}"
-        room_uri = f"bldg:{room_name}"
-
-        # 每个房间独立rng决定 subtype / area，保证可复现
-        rng_room = random.Random(f"{seed_val}_{i}_room")
-        subtype = _room_type_for_index(i, rng_room)
-        area_val = _random_area_m2(i, rng_room)
-
-        # 2.1 拓扑关系
-        lines.append(f"bldg:F1 {rel_hasPart} {room_uri} .\n")
 
-        # 2.2 房间类型
-        if use_rec:
-            lines.append(f"{room_uri} a {room_superclass} .\n")
-        else:
-            lines.append(f"{room_uri} a {room_superclass} , brick:{subtype} .\n")
-
-        # 2.3 房间面积
-        lines.append(f"""{room_uri} brick:area [
-  brick:value {area_val} ;
+    with open(out_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(ttl_header(use_rec=use_rec))
+
+        # (0) 定义可测量量，挂到 Air_Quality 上
+        f.write(
+            "bldg:CO2_Level a brick:Quantity ;\n"
+            "  rdfs:subClassOf brick:Air_Quality .\n\n"
+            "bldg:PM25_Level a brick:Quantity ;\n"
+            "  rdfs:subClassOf brick:Air_Quality .\n\n"
+        )
+        f.write(hierarchy)
+        f.write(f"""bldg:F1 brick:area [
+  brick:value {floor_area_val} ;
   brick:hasUnit unit:M2
 ] .\n\n""")
 
-        # (3) 常规传感器 (Temp / RH / Lux)
-        lines.append(f"""{room_uri}_Temp a brick:Air_Temperature_Sensor ;
-  brick:isPointOf {room_uri} ;
-  brick:hasUnit unit:DEG_C ;
-  ref:hasTimeseriesReference [
-    a ref:TimeseriesReference ;
-    ref:hasTimeseriesId "{room_name.lower()}.temp" ;
-    ref:storedAt bldg:TSDB
-  ] .
-""")
-
-        lines.append(f"""{room_uri}_RH a brick:Relative_Humidity_Sensor ;
-  brick:isPointOf {room_uri} ;
-  brick:hasUnit unit:PERCENT_RH ;
-  ref:hasTimeseriesReference [
-    a ref:TimeseriesReference ;
-    ref:hasTimeseriesId "{room_name.lower()}.rh" ;
-    ref:storedAt bldg:TSDB
-  ] .
-""")
-
-        lines.append(f"""{room_uri}_Lux a brick:Illuminance_Sensor ;
-  brick:isPointOf {room_uri} ;
-  brick:hasUnit unit:LUX ;
-  ref:hasTimeseriesReference [
-    a ref:TimeseriesReference ;
-    ref:hasTimeseriesId "{room_name.lower()}.lux" ;
-    ref:storedAt bldg:TSDB
-  ] .
-""")
+        # (2) Room 循环：每个房间整块套模板，边生成边写，不再攒一个大 list
+        subtypes, areas = _build_room_meta(num_rooms, seed_val)
+        for i in range(1, num_rooms + 1):
+            room_name = f"Room_{i:03d}"
+            room_uri = f"bldg:{room_name}"
+            room_name_lower = room_name.lower()
+            subtype = subtypes[i - 1]
+            # REC 模式只有 rec:Room；Brick 模式再带上具体子类
+            room_types = "rec:Room" if use_rec else f"brick:Room , brick:{subtype}"
+            f.write(_ttl_room_block(rel_hasPart, room_uri, room_types, areas[i - 1], room_name_lower))
 
-        # (4) IAQ 传感器 (CO2 / PM2.5)
-        if include_iaq and (subtype in IAQ_ELIGIBLE_TYPES):
-            lines.append(f"""{room_uri}_CO2 a brick:CO2_Level_Sensor ;
-  brick:isPointOf {room_uri} ;
-  brick:hasUnit unit:PPM ;
-  brick:measures bldg:CO2_Level ;
-  ref:hasTimeseriesReference [
-    a ref:TimeseriesReference ;
-    ref:hasTimeseriesId "{room_name.lower()}.co2" ;
-    ref:storedAt bldg:TSDB
-  ] .
-""")
+            # (4) IAQ 传感器 (CO2 / PM2.5)
+            if include_iaq and (subtype in IAQ_ELIGIBLE_TYPES):
+                f.write(_ttl_room_iaq_block(room_uri, room_name_lower))
 
-            lines.append(f"""{room_uri}_PM25 a brick:PM2.5_Sensor ;
-  brick:isPointOf {room_uri} ;
-  brick:hasUnit unit:MicroGM-PER-M3 ;
-  brick:measures bldg:PM25_Level ;
-  ref:hasTimeseriesReference [
-    a ref:TimeseriesReference ;
-    ref:hasTimeseriesId "{room_name.lower()}.pm25" ;
-    ref:storedAt bldg:TSDB
-  ] .
-""")
-
-    # (5) TSDB节点 + 单位/量纲声明
-    lines.append("bldg:TSDB a ref:ExternalReference .\n\n")
-
-    lines += [
-        # 舒适环境指标
-        "unit:DEG_C a qudt:Unit .\n",
-        "unit:PERCENT_RH a qudt:Unit .\n",
-        "unit:LUX a qudt:Unit .\n",
-        # 面积
-        "unit:M2 a qudt:Unit .\n",
-        # IAQ
-        "unit:PPM a qudt:Unit .\n",
-        "unit:MicroGM-PER-M3 a qudt:Unit .\n",
-        # 量纲
-        "quantitykind:Temperature a qudt:QuantityKind .\n",
-        "quantitykind:RelativeHumidity a qudt:QuantityKind .\n",
-        "quantitykind:Illuminance a qudt:QuantityKind .\n",
-        "quantitykind:Air_Quality a qudt:QuantityKind .\n",
-    ]
-
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.writelines(lines)
+        # (5) TSDB节点 + 单位/量纲声明
+        f.write("bldg:TSDB a ref:ExternalReference .\n\n")
+        f.write(UNIT_DECLARATIONS)
 
 
 # --------------------------- CSV writer ---------------------------
@@ -311,91 +419,108 @@ def generate_timeseries_csv(
     seed_val=None,
     include_unit_in_csv: bool = True,
     include_iaq: bool = True,
+    workers: int = 1,
 ):
     """
     写出 long-form CSV:
     ts_id,timestamp,value,unit
     room_001.temp,2025-10-20T00:00:00+08:00,23.15,DEG_C
+    room_001.temp,2025-10-20T01:00:00+08:00,22.87,DEG_C
     ...
+    按 ts_id 成块输出（每个房间依次 temp / rh / lux / co2 / pm25，块内按时间），
+    同一 ts_id 的行相邻，下游按 ts_id 分批导入 TSDB / 建索引时是顺序读。
     对 IAQ (co2 / pm25): 只在有 IAQ 传感器的房间才写。
+    workers > 1 时按房间分片，多进程并行格式化（受 GIL 限制的主要是这一步）。
     """
 
-    # 这个全局random我们拿来抖动每个采样点，不要用它决定房间类型
-    if seed_val is not None:
-        random.seed(seed_val)
-
     start_local, end_local = local_range_from_today_back(tz_name, days_back)
     times_local = gen_time_points_multiday(start_local, end_local, points_per_day)
 
-    fieldnames = ["ts_id", "timestamp", "value"]
+    # 所有房间一天内的基础值一次算完，按天平铺，再整块加高斯抖动、截断到合理范围
+    room_idx = np.arange(1, num_rooms + 1)
+    t_norm = np.arange(points_per_day) / points_per_day
+    signals = _simulate_signals(room_idx, t_norm, len(times_local), _np_rng(seed_val))
+
+    # 时间戳字符串所有房间共用，只格式化一次
+    ts_iso_list = iso_timestamps(times_local, points_per_day)
+
+    # 有无 unit 列在入口处一次定好：每路传感器的行尾要么是 ",UNIT"，要么是空串
     if include_unit_in_csv:
-        fieldnames.append("unit")
+        header = "ts_id,timestamp,value,unit"
+        sensor_cols = [(suffix, spec, f",{unit}") for suffix, unit, spec in CSV_SENSORS]
+    else:
+        header = "ts_id,timestamp,value"
+        sensor_cols = [(suffix, spec, "") for suffix, _, spec in CSV_SENSORS]
+
+    # 和 TTL 保持一致的房间subtype/是否IAQ逻辑
+    subtypes, _ = _build_room_meta(num_rooms, seed_val)
+    has_iaq_list = [include_iaq and (subtype in IAQ_ELIGIBLE_TYPES) for subtype in subtypes]
+
+    workers = max(1, min(workers, num_rooms))
+    if workers == 1:
+        with open(out_path, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(header + CSV_LINE_END)
+            _write_csv_rooms(f, 1, signals, has_iaq_list, ts_iso_list, sensor_cols)
+        return
+
+    # 多进程：按房间连续切成 workers 段，各进程写自己的分片文件，最后按顺序拼接；
+    # 抖动已在主进程一次生成好、按段切给子进程，所以内容与单进程逐字节相同
+    bounds = np.linspace(0, num_rooms, workers + 1).astype(int)
+    part_paths = [f"{out_path}.part{k}" for k in range(workers)]  # 分片临时文件与 CSV 同目录
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    _write_csv_shard, part_paths[k], int(lo) + 1, signals[:, lo:hi],
+                    has_iaq_list[lo:hi], ts_iso_list, sensor_cols,
+                )
+                for k, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:]))
+            ]
+            for fut in futures:
+                fut.result()
+
+        with open(out_path, "wb") as dst:
+            dst.write((header + CSV_LINE_END).encode("utf-8"))
+            for part in part_paths:
+                with open(part, "rb") as src:
+                    shutil.copyfileobj(src, dst, WRITE_BUFFER_SIZE)
+    finally:
+        for part in part_paths:
+            if os.path.exists(part):
+                os.remove(part)
+
+
+def _write_csv_rooms(f, first_room: int, signals: np.ndarray, has_iaq_list: List[bool],
+                     ts_iso_list: List[str], sensor_cols: List[Tuple[str, str, str]]) -> None:
+    """
+    把 signals[:, r, :] 依次写成 room_{first_room + r} 的行。
+    每个房间的行先拼成一个字符串，每个房间只 write 一次；
+    房间内按传感器成块：room_001.temp 的全部时刻、再 room_001.rh ……
+    """
+    for r in range(signals.shape[1]):
+        room_id = f"room_{first_room + r:03d}"
+        n_sensors = len(sensor_cols) if has_iaq_list[r] else 3  # 后两路是 IAQ
 
-    with open(out_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+        blocks: List[str] = []
+        for k in range(n_sensors):
+            suffix, spec, unit_col = sensor_cols[k]
+            ts_id = f"{room_id}.{suffix}"
+            # 转成 Python float 列表，逐行取值时不再经过 NumPy 标量
+            values = signals[k, r].tolist()
+            block = CSV_LINE_END.join([f"{ts_id},{ts_iso},{v:{spec}}{unit_col}" for ts_iso, v in zip(ts_iso_list, values)])
+            if spec == ".2f":
+                # 整块去一次末尾的 0，比逐个值 round() 再 str() 快约一倍
+                block = _TRAILING_ZERO_RE.sub(r"\1", block)
+            blocks.append(block)
 
-        for i in range(1, num_rooms + 1):
-            room_id = f"room_{i:03d}"
-
-            # 和 TTL 保持一致的房间subtype/是否IAQ逻辑
-            rng_room = random.Random(f"{seed_val}_{i}_room")
-            subtype = _room_type_for_index(i, rng_room)
-            has_iaq = include_iaq and (subtype in IAQ_ELIGIBLE_TYPES)
-
-            for idx, t in enumerate(times_local):
-                t_norm = (idx % points_per_day) / points_per_day
-                temp_b, rh_b, lux_b, co2_b, pm25_b = daily_shapes(i, t_norm)
-
-                temp = jitter(temp_b, 0.25)
-                rh = max(0.0, min(100.0, jitter(rh_b, 1.5)))
-                lux = max(0.0, jitter(lux_b, 25.0))
-                co2 = max(350.0, jitter(co2_b, 30.0))
-                pm25 = max(2.0, jitter(pm25_b, 2.5))
-
-                ts_iso = t.isoformat()
-
-                base_rows = [
-                    {
-                        "ts_id": f"{room_id}.temp",
-                        "timestamp": ts_iso,
-                        "value": round(temp, 2),
-                        **({"unit": "DEG_C"} if include_unit_in_csv else {}),
-                    },
-                    {
-                        "ts_id": f"{room_id}.rh",
-                        "timestamp": ts_iso,
-                        "value": round(rh, 2),
-                        **({"unit": "PERCENT_RH"} if include_unit_in_csv else {}),
-                    },
-                    {
-                        "ts_id": f"{room_id}.lux",
-                        "timestamp": ts_iso,
-                        "value": round(lux, 1),
-                        **({"unit": "LUX"} if include_unit_in_csv else {}),
-                    },
-                ]
-
-                if has_iaq:
-                    base_rows.append(
-                        {
-                            "ts_id": f"{room_id}.co2",
-                            "timestamp": ts_iso,
-                            "value": round(co2, 1),
-                            **({"unit": "PPM"} if include_unit_in_csv else {}),
-                        }
-                    )
-                    base_rows.append(
-                        {
-                            "ts_id": f"{room_id}.pm25",
-                            "timestamp": ts_iso,
-                            "value": round(pm25, 1),
-                            **({"unit": "MicroGM-PER-M3"} if include_unit_in_csv else {}),
-                        }
-                    )
-
-                for r in base_rows:
-                    writer.writerow(r)
+        f.write(CSV_LINE_END.join(blocks) + CSV_LINE_END)
+
+
+def _write_csv_shard(part_path: str, first_room: int, signals: np.ndarray, has_iaq_list: List[bool],
+                     ts_iso_list: List[str], sensor_cols: List[Tuple[str, str, str]]) -> None:
+    """子进程入口：一段连续房间写进自己的分片文件（不带表头）"""
+    with open(part_path, "w", newline="", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+        _write_csv_rooms(f, first_room, signals, has_iaq_list, ts_iso_list, sensor_cols)
 
 
 # --------------------------- CLI ---------------------------
@@ -421,6 +546,8 @@ def main():
                         help="Use REC-like location classes instead of Brick's Room/Floor/etc")
     parser.add_argument("--no-iaq", action="store_true",
                         help="Disable CO2 / PM2.5 sensors altogether")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes used to format timeseries.csv (rooms are sharded; output is identical)")
     args = parser.parse_args()
 
     # init tz
@@ -460,6 +587,7 @@ def main():
         seed_val=seed_val,
         include_unit_in_csv=not args.no_unit_in_csv,
         include_iaq=(not args.no_iaq),
+        workers=args.workers,
     )
 
     print(f"Wrote:\n  {ttl_path}\n  {csv_path}")
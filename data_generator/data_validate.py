@@ -13,8 +13,19 @@ Validate and introspect a Brick/REC building model.
 """
 
 import csv
+import mmap
+import re
 import warnings
 from pathlib import Path
+from typing import Optional
+
+import rdflib
+from rdflib import Namespace, RDF
+
+try:
+    import pandas as pd  # 可选：C 解析器读大 CSV 快得多
+except ImportError:
+    pd = None
 
 # ========== 静音不相关的警告（输出更干净） ==========
 warnings.filterwarnings("ignore", category=UserWarning, module="rdflib_sqlalchemy")
@@ -23,6 +34,12 @@ warnings.filterwarnings("ignore", category=UserWarning, module="rdflib_sqlalchem
 TTL_PATH = Path(r"F:\Task\RAG-LangGraph-Demo\data\topology.ttl")
 CSV_PATH = Path(r"F:\Task\RAG-LangGraph-Demo\data\timeseries.csv")
 
+REF = Namespace("https://brickschema.org/schema/Brick/ref#")
+
+# 行首第一列（到第一个逗号为止）；紧随其后的同 ts_id 行并进同一次匹配，
+# data_generator 按 ts_id 成块输出，每块只产生一个匹配对象
+_FIRST_COL_RUN_RE = re.compile(rb"^([^,\r\n]*),[^\n]*(?:\n\1,[^\n]*)*", re.M)
+
 # ========== QUDT 词表（本地优先，其次远程） ==========
 QUDT_UNIT_LOCAL = Path("qudt-unit.ttl")
 QUDT_QK_LOCAL = Path("qudt-quantitykind.ttl")
@@ -39,25 +56,57 @@ QUDT_QK_VOCABS = [
 ]
 
 
+def _vocab_cache_path(local_path: Path) -> Path:
+    """qudt-unit.ttl -> qudt-unit.cache.nt，与本地词表同目录（从远程拿到的也缓存在这里）"""
+    return local_path.with_name(local_path.stem + ".cache.nt")
+
+
+def _save_vocab_cache(vocab, cache_path: Path, label: str) -> None:
+    try:
+        # 先写临时文件再替换，避免中断时留下半截缓存
+        tmp = cache_path.with_suffix(".nt.tmp")
+        vocab.serialize(destination=tmp.as_posix(), format="nt", encoding="utf-8")
+        tmp.replace(cache_path)
+        print(f"[{label}] Cached as N-Triples: {cache_path}")
+    except Exception as e:
+        print(f"[{label}] Failed to write cache {cache_path}: {e}")
+
+
 def load_vocab(graph, local_path: Path, remotes: list[str], label: str) -> bool:
     """
-    按优先级加载 QUDT 之类的词表：本地 -> 远程。
+    按优先级加载 QUDT 之类的词表：缓存 -> 本地 -> 远程。
+    从本地/远程加载成功后另存一份 N-Triples 缓存：逐行格式，rdflib 解析比 Turtle 快，
+    远程词表也不用每次重新下载。本地词表比缓存新时缓存作废。
     成功返回 True。
     """
+    cache_path = _vocab_cache_path(local_path) if local_path else None
+    if cache_path and cache_path.exists():
+        stale = local_path.exists() and local_path.stat().st_mtime_ns > cache_path.stat().st_mtime_ns
+        if not stale:
+            try:
+                graph.parse(cache_path.as_posix(), format="nt")
+                print(f"[{label}] Loaded cache: {cache_path}")
+                return True
+            except Exception as e:
+                print(f"[{label}] Failed to load cache {cache_path}: {e}")
+
+    # 先解析进单独的图：缓存里只放词表本身，不混进 Brick 本体和模型
+    sources = []
     if local_path and local_path.exists():
+        sources.append((local_path.as_posix(), f"local: {local_path}"))
+    sources += [(uri, f"remote: {uri}") for uri in remotes]
+    for src, desc in sources:
+        vocab = rdflib.Graph()
         try:
-            graph.parse(local_path.as_posix(), format="turtle")
-            print(f"[{label}] Loaded local: {local_path}")
-            return True
-        except Exception as e:
-            print(f"[{label}] Failed to load local {local_path}: {e}")
-    for uri in remotes:
-        try:
-            graph.parse(uri, format="turtle")
-            print(f"[{label}] Loaded remote: {uri}")
-            return True
+            vocab.parse(src, format="turtle")
         except Exception as e:
-            print(f"[{label}] Failed to load remote {uri}: {e}")
+            print(f"[{label}] Failed to load {desc}: {e}")
+            continue
+        graph += vocab
+        print(f"[{label}] Loaded {desc}")
+        if cache_path:
+            _save_vocab_cache(vocab, cache_path, label)
+        return True
     return False
 
 
@@ -66,14 +115,12 @@ def extract_timeseries_ids_from_ttl(g):
     从 TTL 模型里提取所有 ref:hasTimeseriesId 的字符串集合。
     用于和 CSV 的 ts_id 做对照。
     """
-    q_tsid = """
-    PREFIX ref: <https://brickschema.org/schema/Brick/ref#>
-    SELECT ?tsid WHERE {
-      ?ref a ref:TimeseriesReference ;
-           ref:hasTimeseriesId ?tsid .
+    # 只有一个谓词加一个类型约束，直接走三元组索引，不经过 SPARQL 解析/规划
+    return {
+        str(tsid)
+        for ref, tsid in g.subject_objects(REF.hasTimeseriesId)
+        if (ref, RDF.type, REF.TimeseriesReference) in g
     }
-    """
-    return {str(row.tsid) for row in g.query(q_tsid)}
 
 
 def extract_ts_ids_from_csv(csv_path: Path):
@@ -84,16 +131,39 @@ def extract_ts_ids_from_csv(csv_path: Path):
         print(f"[CSV] 未找到 CSV 文件: {csv_path}")
         return set()
 
-    ts_ids = set()
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
         # 期望列: ts_id, timestamp, value, [unit]
-        if "ts_id" not in reader.fieldnames:
+        header = next(reader, [])
+        if "ts_id" not in header:
             print("[CSV] 警告：CSV 中没有 ts_id 列，无法做一致性检查。")
             return set()
-        for row in reader:
-            ts_ids.add(row["ts_id"])
-    return ts_ids
+        if header[0] == "ts_id" and len(header) > 1:
+            # 生成器的格式：ts_id 在第一列、不带引号，直接在 mmap 上按字节扫行首，
+            # 不逐行构造行对象，内存只随不同 ts_id 的个数增长；有引号字段时退回下面的解析
+            ids = _scan_first_column(csv_path)
+            if ids is not None:
+                return ids
+        if pd is None:
+            # 没装 pandas：按列下标取，不为每行构造 dict
+            ts_idx = header.index("ts_id")
+            return {row[ts_idx] for row in reader if len(row) > ts_idx}
+
+    # 只解析 ts_id 一列；空串保持原样，不转成 NaN
+    ts_col = pd.read_csv(csv_path, usecols=["ts_id"], dtype=str, keep_default_na=False)["ts_id"]
+    return set(ts_col.unique())
+
+
+def _scan_first_column(csv_path: Path) -> Optional[set]:
+    """跳过表头，返回 CSV 第一列的去重集合；正文里有引号（字段可能含逗号/换行）时返回 None"""
+    with open(csv_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        body_start = mm.find(b"\n") + 1
+        if body_start == 0:  # 只有表头一行
+            return set()
+        if mm.find(b'"', body_start) != -1:
+            return None
+        raw = {m.group(1) for m in _FIRST_COL_RUN_RE.finditer(mm, body_start)}
+    return {x.decode("utf-8") for x in raw}
 
 
 def main():